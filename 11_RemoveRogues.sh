@@ -52,6 +52,11 @@ do
             shift
             previousAligner="-p $1"
             ;;
+        --preFilter)
+            ;&
+        -r)
+            preFilter="1"
+            ;;
         -*)
             ;&
         --*)
@@ -101,15 +106,32 @@ baseShrunken="$rogueFreeTreesDir/$base.txt"
 consenseTree="$alignmentDir/$alignmentBase.contree"
 seqsOfInterestIDs="$seqsOfInterestDir/SequencesOfInterestIDs.txt"
 droppedFinal="$rogueFreeTreesDir/$base.dropped.fasta"
+leafStabilityBase="$rogueFreeTreesDir/LeafStability.$base"
+leafStabilityDropped="$leafStabilityBase.candidates.txt"
+prunedTrees="$rogueFreeTreesDir/LeafStability_prunedTrees.$base.ufboot"
 
 # If we call this again we want to overwrite the output
 rm -f "$baseRogueNaRokDroppedCSV"
 rm -f "$baseRogueNaRokDropped"
 rm -f "$rogueFreeTreesDir/RogueNaRok_info.$base"
 rm -f "$rogueFreeTreesDir/RogueNaRok_info.$bbase"
+rm -f "$leafStabilityBase.tsv" "$leafStabilityDropped" "$prunedTrees"
+
+rogueNaRokTrees="$inputTrees"
+
+# Drop the leaves with the most unstable positions first, so that RogueNaRok gets fewer leaves.
+# A candidate must be at least twice as unstable as the median leaf, without rogues there are none.
+if [ -n "$preFilter" ]
+then
+	python3 "$DIR/11d_LeafStabilityPrefilter.py" -i "$inputTrees" -o "$leafStabilityBase" -p "$prunedTrees"
+	if [ -s "$leafStabilityDropped" ]
+	then
+		rogueNaRokTrees="$prunedTrees"
+	fi
+fi
 
-"$DIR/../RogueNaRok/RogueNaRok-parallel" -s 2 -i $inputTrees -n $base -w $rogueFreeTreesDir -T $numTreads
-"$DIR/../RogueNaRok/RogueNaRok-parallel" -s 2 -i $inputTrees -n $bbase -b -w $rogueFreeTreesDir -T $numTreads
+"$DIR/../RogueNaRok/RogueNaRok-parallel" -s 2 -i $rogueNaRokTrees -n $base -w $rogueFreeTreesDir -T $numTreads
+"$DIR/../RogueNaRok/RogueNaRok-parallel" -s 2 -i $rogueNaRokTrees -n $bbase -b -w $rogueFreeTreesDir -T $numTreads
 
 # Creates a .contree file in the target directory
 run_treeshrink.py -t "$consenseTree" -o "$rogueFreeTreesDir" -f -O "$base"
@@ -117,6 +139,10 @@ run_treeshrink.py -t "$consenseTree" -o "$rogueFreeTreesDir" -f -O "$base"
 grep -o -f "$seqsOfInterestIDs" "$baseRogueNaRokDropped" > "$baseRogueNaRokDroppedCSV"
 grep -o -f "$seqsOfInterestIDs" "$bbaseRogueNaRokDropped" >> "$baseRogueNaRokDroppedCSV"
 grep -o -f "$seqsOfInterestIDs" "$baseShrunken" >> "$baseRogueNaRokDroppedCSV"
+if [ -s "$leafStabilityDropped" ]
+then
+	grep -o -f "$seqsOfInterestIDs" "$leafStabilityDropped" >> "$baseRogueNaRokDroppedCSV"
+fi
 
 seqkit grep -f "$baseRogueNaRokDroppedCSV" -j "$numTreads" "$seqsOfInterestDir/$base.fasta" > "$droppedFinal"
 
@@ -0,0 +1,174 @@
+#!/bin/python3
+
+import decimal # Same numbers as bc
+import glob
+import multiprocessing
+import os
+import re
+import sys, getopt # Parse program arguments
+
+import numpy as np
+
+# The SH-aLRT/aBayes/UFBoot labels of IQ-Tree, as matched by the grep before
+supportPattern = re.compile(rb"[0-9]+\.[0-9]+/[0-9]+\.[0-9]+/[0-9]+")
+
+# The usual thresholds for well supported nodes in IQ-Tree trees
+SHaLRTThreshold = 80.0
+aBayesThreshold = 0.95
+UFBootThreshold = 95.0
+
+supportNames = ["SHaLRT", "aBayes", "UFBoot"]
+
+###############################################################################
+def usage(progName):
+	print(progName, "calculates support statistics of the SH-aLRT/aBayes/UFBoot labels")
+	print("of all treefiles in a directory and writes them to TreeStatistics.csv.")
+	print("For each tree the averages come first, as before, followed by the number of")
+	print("labeled nodes, the median and the quartiles, and the fraction of nodes with")
+	print("SH-aLRT >= 80, aBayes >= 0.95, UFBoot >= 95, and all three. The last line has")
+	print("the average of the tree averages and the other statistics over all nodes.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -i, --inputDir            <inputDir>      The directory with the treefiles.')
+	print(' -o, --outputDir           <outputDir>     The directory for TreeStatistics.csv, default is inputDir.')
+	print(' -j, --jobs                <numJobs>       The number of trees read at the same time, default are the available CPUs.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	inputDir  = ""
+	outputDir = ""
+	numJobs   = 0
+
+	try:
+		opts, args = getopt.getopt(argv,"hi:o:j:",["help", "inputDir=", "outputDir=", "jobs="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-i", "--inputDir"):
+			inputDir = arg
+		elif opt in ("-o", "--outputDir"):
+			outputDir = arg
+		elif opt in ("-j", "--jobs"):
+			numJobs = int(arg)
+
+	if inputDir == "":
+		usage(progName)
+		sys.exit(2)
+
+	if outputDir == "":
+		outputDir = inputDir
+
+	if numJobs <= 0:
+		numJobs = len(os.sched_getaffinity(0))
+
+	return inputDir, outputDir, numJobs
+
+###############################################################################
+def formatLikeBc(value):
+	# bc -l truncates to 20 decimals and drops the zero before the point
+	if value == 0:
+		return "0"
+
+	text = format(value, "f")
+	if text.startswith("0."):
+		return text[1:]
+	if text.startswith("-0."):
+		return "-" + text[2:]
+	return text
+
+###############################################################################
+def divideLikeBc(dividend, divisor):
+	with decimal.localcontext() as context:
+		context.prec     = 60
+		context.rounding = decimal.ROUND_DOWN
+		return (dividend / divisor).quantize(decimal.Decimal(10) ** -20)
+
+###############################################################################
+def getExactSum(column, values):
+	# The sum of the decimal numbers without rounding, as bc adds them. Scaled
+	# by the largest number of decimals, the float values are exact integers,
+	# and their sum fits into 64 bits, otherwise they are added as decimals.
+	numDecimals = max(map(len, re.findall(rb"\.([0-9]+)", b" ".join(column))), default=0)
+	largest = np.max(values) * 10 ** numDecimals
+	if largest >= 2 ** 52 or largest * len(values) >= 2 ** 63:
+		return sum(decimal.Decimal(value.decode("ascii")) for value in column)
+
+	scaledSum = int(np.sum(np.rint(values * 10 ** numDecimals).astype(np.int64)))
+	return decimal.Decimal(scaledSum).scaleb(-numDecimals)
+
+###############################################################################
+def readSupportValues(treeFile):
+	# Returns the exact sums of the three columns, as bc adds them,
+	# and the values as array with a row per labeled node
+	with open(treeFile, "rb") as treeIn:
+		labels = supportPattern.findall(treeIn.read())
+
+	if len(labels) == 0:
+		return treeFile, None, None
+
+	columns = np.array(b"/".join(labels).split(b"/")).reshape(-1, 3)
+	values  = columns.astype(float)
+	sums    = [getExactSum(columns[:, i], values[:, i]) for i in range(3)]
+	return treeFile, sums, values
+
+###############################################################################
+def getStatistics(values):
+	# The columns after the averages
+	statistics = [str(len(values))]
+	for i in range(3):
+		median, lowerQuartile, upperQuartile = np.quantile(values[:, i], [0.5, 0.25, 0.75])
+		statistics.extend([f"{median:.4f}", f"{lowerQuartile:.4f}", f"{upperQuartile:.4f}"])
+
+	isSupported = values >= np.array([SHaLRTThreshold, aBayesThreshold, UFBootThreshold])
+	for fraction in list(isSupported.mean(axis=0)) + [isSupported.all(axis=1).mean()]:
+		statistics.append(f"{fraction:.4f}")
+
+	return statistics
+
+###############################################################################
+def calculateSupportStatistics(inputDir, outputDir, numJobs):
+	treeFiles = sorted(glob.glob(inputDir + "/*.treefile"))
+
+	header = ["File"] + [name + "Average" for name in supportNames] + ["NumNodes"]
+	for name in supportNames:
+		header.extend([name + "Median", name + "LowerQuartile", name + "UpperQuartile"])
+	header.extend(["SHaLRTOver80", "aBayesOver0.95", "UFBootOver95", "AllOver"])
+
+	averageSums = [decimal.Decimal(0)] * 3
+	allValues   = []
+
+	with open(os.path.join(outputDir, "TreeStatistics.csv"), "w") as outFile, multiprocessing.Pool(max(1, min(numJobs, len(treeFiles)))) as pool:
+		outFile.write("\t".join(header) + "\n")
+
+		for treeFile, sums, values in pool.imap(readSupportValues, treeFiles, chunksize=8):
+			if sums == None:
+				continue
+
+			averages    = [divideLikeBc(columnSum, len(values)) for columnSum in sums]
+			averageSums = [averageSum + average for averageSum, average in zip(averageSums, averages)]
+			allValues.append(values)
+
+			outFile.write("\t".join([treeFile] + [formatLikeBc(average) for average in averages] + getStatistics(values)) + "\n")
+
+		# bc printed nothing for the averages without any tree
+		if len(allValues) == 0:
+			outFile.write("Average\t\t\t\n")
+			return
+
+		averages = [formatLikeBc(divideLikeBc(averageSum, len(allValues))) for averageSum in averageSums]
+		outFile.write("\t".join(["Average"] + averages + getStatistics(np.concatenate(allValues))) + "\n")
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	inputDir, outputDir, numJobs = parseArgs(sys.argv[0], sys.argv[1:])
+	calculateSupportStatistics(inputDir, outputDir, numJobs)
+
+###############################################################################
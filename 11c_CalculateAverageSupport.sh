@@ -1,5 +1,18 @@
 #!/bin/bash
 
+# Writes the support statistics of all treefiles in inputDir to
+# outputDir/TreeStatistics.csv, see 11c_CalculateAverageSupport.py
+# Parameters: <inputDir> [<outputDir>]
+
+# Get the directory where this script is
+SOURCE="${BASH_SOURCE[0]}"
+while [ -h "$SOURCE" ]; do # resolve $SOURCE until the file is no longer a symlink
+  DIR="$( cd -P "$( dirname "$SOURCE" )" && pwd )"
+  SOURCE="$(readlink "$SOURCE")"
+  [[ $SOURCE != /* ]] && SOURCE="$DIR/$SOURCE" # if $SOURCE was a relative symlink, we need to resolve it relative to the path where the symlink file was located
+done
+DIR="$( cd -P "$( dirname "$SOURCE" )" && pwd )"
+
 inputDir="$1"
 outputDir="$2"
 
@@ -8,49 +21,4 @@ then
 	outputDir="$inputDir"
 fi
 
-outputFile="$outputDir/TreeStatistics.csv"
-
-SHaLRTSum="0"
-aBayesSum="0"
-UFBootSum="0"
-
-i="0"
-
-echo "File	SHaLRTAverage	aBayesAverage	UFBootAverage" > $outputFile
-
-for file in $inputDir/*.treefile
-do
-	values=$(grep -o -E '[[:digit:]]+(\.[[:digit:]]+)/[[:digit:]]+(\.[[:digit:]]+)/[[:digit:]]+' $file)
-	if [ -z "$values" ]
-	then
-		continue
-	fi
-
-	numValues=$(echo "$values" | wc -l)
-
-	SHaLRT=$(echo "$values" | cut -d / -f1)
-	aBayes=$(echo "$values" | cut -d / -f2)
-	UFBoot=$(echo "$values" | cut -d / -f3)
-
-	SHaLRT=$(echo "$SHaLRT" | paste -s -d+ - | bc)
-	aBayes=$(echo "$aBayes" | paste -s -d+ - | bc)
-	UFBoot=$(echo "$UFBoot" | paste -s -d+ - | bc)
-
-	SHaLRT=$(echo "$SHaLRT / $numValues" | bc -l )
-	aBayes=$(echo "$aBayes / $numValues" | bc -l )
-	UFBoot=$(echo "$UFBoot / $numValues" | bc -l )
-
-	SHaLRTSum=$(echo "$SHaLRTSum + $SHaLRT" | bc -l )
-	aBayesSum=$(echo "$aBayesSum + $aBayes" | bc -l )
-	UFBootSum=$(echo "$UFBootSum + $UFBoot" | bc -l )
-
-	echo "$file	$SHaLRT	$aBayes	$UFBoot" >> $outputFile
-
-	((i++))
-done
-
-SHaLRTAverage=$(echo "$SHaLRTSum / $i" | bc -l )
-aBayesAverage=$(echo "$aBayesSum / $i" | bc -l )
-UFBootAverage=$(echo "$UFBootSum / $i" | bc -l )
-
-echo "Average	$SHaLRTAverage	$aBayesAverage	$UFBootAverage" >> $outputFile
+python3 "$DIR/11c_CalculateAverageSupport.py" -i "$inputDir" -o "$outputDir"
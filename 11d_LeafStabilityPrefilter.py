@@ -0,0 +1,372 @@
+#!/bin/python3
+
+import re
+import sys, getopt # Parse program arguments
+
+import numpy as np
+
+###############################################################################
+def usage(progName):
+	print(progName, "ranks the leaves of a set of bootstrap trees, such as an IQ-Tree .ufboot file,")
+	print("by how unstable their position is, to find rogue candidates before RogueNaRok.")
+	print("The instability of a leaf is the mean over the other leaves of the coefficient")
+	print("of variation of the path length between them over all trees, a variance form of")
+	print("the taxonomic instability index. Leaves whose instability is far above the others,")
+	print("measured as robust z-score, are rogue candidates, if their instability is also a")
+	print("multiple of the median instability. The z-score alone always flags the tail of the")
+	print("leaves, even if there are no rogues. The ranking is written to <outPrefix>.tsv,")
+	print("the candidates one per line to <outPrefix>.candidates.txt.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -i, --infile              <infile>        The file with the trees, one per line.')
+	print(' -o, --outPrefix           <outPrefix>     The prefix of the output files.')
+	print(' -z, --zScore              <zScore>        The robust z-score above which a leaf is a candidate, default 3.5.')
+	print(' -r, --minRatio            <ratio>         The minimum ratio of the instability of a candidate to the median, default 2.')
+	print(' -n, --maxCandidates       <number>        The maximum number of candidates, default is no limit.')
+	print(' -p, --prunedTrees         <prunedTrees>   Writes the trees without the candidates to this file,')
+	print('                                           without branch lengths and support values.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	infile        = ""
+	outPrefix     = ""
+	zScore        = 3.5
+	minRatio      = 2.0
+	maxCandidates = 0
+	prunedTrees   = ""
+
+	try:
+		opts, args = getopt.getopt(argv,"hi:o:z:r:n:p:",["help", "infile=", "outPrefix=", "zScore=", "minRatio=", "maxCandidates=", "prunedTrees="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-i", "--infile"):
+			infile = arg
+		elif opt in ("-o", "--outPrefix"):
+			outPrefix = arg
+		elif opt in ("-z", "--zScore"):
+			zScore = float(arg)
+		elif opt in ("-r", "--minRatio"):
+			minRatio = float(arg)
+		elif opt in ("-n", "--maxCandidates"):
+			maxCandidates = int(arg)
+		elif opt in ("-p", "--prunedTrees"):
+			prunedTrees = arg
+
+	if infile == "" or outPrefix == "":
+		usage(progName)
+		sys.exit(2)
+
+	return infile, outPrefix, zScore, minRatio, maxCandidates, prunedTrees
+
+###############################################################################
+# A label is everything between the structure characters, quoted names may contain them
+newickTokenPattern = re.compile(r"'[^']*'|[(),;]|[^(),;']+")
+
+structureCharacters = np.frombuffer(b"(),;", dtype=np.uint8)
+
+###############################################################################
+def getLeafLabel(label):
+	# The label without branch length
+	label = label.strip()
+	if label.startswith("'"):
+		return label[:label.index("'", 1) + 1]
+
+	return label.split(":")[0]
+
+###############################################################################
+def getLeafName(label):
+	# The name as RogueNaRok reports it
+	return getLeafLabel(label).strip("'")
+
+###############################################################################
+def readTree(newick, leafIndex):
+	# Reads one Newick tree with numpy instead of a loop over the tokens. Returns
+	# the shared leaf index of the leaves in the order of the tree, their depths,
+	# the depths of the last common ancestors of neighbouring leaves, and the
+	# leaves below each inner node as range in the order of the tree. A
+	# neighbouring pair shares the ancestor at the lowest nesting level between them.
+	text = np.frombuffer(newick, dtype=np.uint8)
+
+	# Quoted names may contain the structure characters
+	isOutside = np.cumsum(text == ord("'")) % 2 == 0
+	structure = np.flatnonzero(np.isin(text, structureCharacters) & isOutside)
+	characters = text[structure]
+	treeEnds = np.flatnonzero(characters == ord(";"))
+	if len(treeEnds) > 0:
+		structure  = structure[:treeEnds[0] + 1]
+		characters = characters[:treeEnds[0] + 1]
+
+	isOpen  = characters == ord("(")
+	isClose = characters == ord(")")
+	depths  = np.cumsum(isOpen.astype(np.int32) - isClose)
+
+	# A leaf is a label after an opening bracket or a comma
+	labelEnds = np.append(structure[1:], len(text))
+	isLeaf = (isOpen | (characters == ord(","))) & (labelEnds - structure > 1)
+	leaves = np.flatnonzero(isLeaf)
+
+	labels = [newick[labelStart:labelEnd] for labelStart, labelEnd in zip((structure[leaves] + 1).tolist(), labelEnds[leaves].tolist())]
+	if b"'" in newick:
+		leafNames = [getLeafName(label.decode()) for label in labels]
+	else:
+		leafNames = [label.split(b":", 1)[0].strip().decode() for label in labels]
+	positions = np.array([leafIndex.setdefault(leafName, len(leafIndex)) for leafName in leafNames], dtype=np.int64)
+
+	leafDepths     = depths[leaves]
+	ancestorDepths = np.minimum.reduceat(depths, leaves)[:-1] - 1 if len(leaves) > 0 else leafDepths
+
+	# The brackets of a level alternate between opening and closing
+	levels = np.where(isOpen, depths, depths + 1)
+	brackets = np.flatnonzero(isOpen | isClose)
+	brackets = brackets[np.lexsort((brackets, levels[brackets]))].reshape(-1, 2)
+	numLeavesBefore = np.cumsum(isLeaf) - isLeaf
+	clusterStarts = numLeavesBefore[brackets[:, 0]]
+	clusterEnds   = numLeavesBefore[brackets[:, 1]]
+
+	return positions, leafDepths, ancestorDepths, clusterStarts, clusterEnds
+
+###############################################################################
+# The number of path lengths computed at once, the memory grows with it
+# instead of with the square of the number of leaves
+blockElements = 1 << 18
+
+###############################################################################
+def getPathLengths(leafDepths, ancestorDepths, rows):
+	# The number of edges from the leaves at the given positions of the tree to
+	# all leaves in the order of the tree. The last common ancestor of two leaves
+	# is the shallowest one of the neighbouring pairs between them, the running
+	# minima of the neighbouring pairs from each row to the right and to the left.
+	numLeaves = len(leafDepths)
+	columns   = np.arange(numLeaves - 1)
+	isRight   = columns >= rows[:, np.newaxis]
+
+	right = np.where(isRight, ancestorDepths, numLeaves)
+	np.minimum.accumulate(right, axis=1, out=right)
+	left = np.minimum.accumulate(np.where(isRight, numLeaves, ancestorDepths)[:, ::-1], axis=1)[:, ::-1]
+
+	ancestors = np.empty((len(rows), numLeaves), dtype=right.dtype)
+	ancestors[:, 0]  = numLeaves
+	ancestors[:, 1:] = right
+	np.minimum(ancestors[:, :-1], left, out=ancestors[:, :-1])
+
+	pathLengths = leafDepths[rows][:, np.newaxis] + leafDepths - 2 * ancestors
+	pathLengths[np.arange(len(rows)), rows] = 0
+	return pathLengths
+
+###############################################################################
+def getBipartitionHashes(positions, clusterStarts, clusterEnds, leafHashes):
+	# The non trivial bipartitions of one tree as the xor of the random numbers of
+	# the leaves on the side without the first leaf of the shared index, and the
+	# leaves below their inner node as range in the order of the tree. The xor
+	# of a range is looked up in the running xor over the leaves of the tree.
+	numLeaves = len(positions)
+	prefixes = np.zeros(numLeaves + 1, dtype=np.uint64)
+	np.bitwise_xor.accumulate(leafHashes[positions], out=prefixes[1:])
+
+	hashes = prefixes[clusterStarts] ^ prefixes[clusterEnds]
+	firstLeaf = np.flatnonzero(positions == 0)[0]
+	hasFirstLeaf = (clusterStarts <= firstLeaf) & (firstLeaf < clusterEnds)
+	hashes[hasFirstLeaf] ^= prefixes[-1]
+
+	sizes = clusterEnds - clusterStarts
+	isInformative = (sizes >= 2) & (sizes <= numLeaves - 2)
+	hashes, first = np.unique(hashes[isInformative], return_index=True)
+	return hashes, clusterStarts[isInformative][first], clusterEnds[isInformative][first]
+
+###############################################################################
+class TreeSet:
+	def __init__(self, treeFile):
+		# The leaf order and depths of each tree, and the non trivial bipartitions
+		# of all trees with their counts. Nothing grows with the square of the
+		# number of leaves, the path lengths are summed up in blocks of leaves.
+		self.leafIndex = {}
+		self.numTrees  = 0
+		self.trees     = []
+		self.clusters  = []
+		leafHashes     = None
+
+		with open(treeFile, "rb") as treesIn:
+			for line in treesIn:
+				if line.strip() == b"":
+					continue
+
+				positions, leafDepths, ancestorDepths, clusterStarts, clusterEnds = readTree(line, self.leafIndex)
+				if leafHashes is None:
+					numLeaves = len(self.leafIndex)
+					leafHashes = np.frombuffer(np.random.default_rng(1).bytes(8 * numLeaves), dtype=np.uint64)
+				if len(positions) != numLeaves or len(self.leafIndex) != numLeaves:
+					raise ValueError("All trees must have the same leaves: " + treeFile + " tree " + str(self.numTrees + 1))
+
+				self.trees.append((positions.astype(np.int32), leafDepths.astype(np.int32), ancestorDepths.astype(np.int32)))
+				self.clusters.append(getBipartitionHashes(positions, clusterStarts.astype(np.int32), clusterEnds.astype(np.int32), leafHashes))
+
+				self.numTrees += 1
+
+		if self.numTrees == 0:
+			raise ValueError("No trees in " + treeFile)
+
+		self.leafNames = sorted(self.leafIndex, key=self.leafIndex.get)
+
+		hashes, counts = np.unique(np.concatenate([hashes for hashes, clusterStarts, clusterEnds in self.clusters]), return_counts=True)
+		self.numBipartitions = len(hashes)
+		self.majority = hashes[counts / self.numTrees > 0.5]
+
+	def getInstabilities(self):
+		# The path lengths and their squares summed over all trees, for a block
+		# of leaves at a time
+		numLeaves     = len(self.leafNames)
+		blockSize     = max(1, min(numLeaves, blockElements // numLeaves))
+		instabilities = np.zeros(numLeaves)
+		if numLeaves < 2:
+			return instabilities
+
+		inverse = np.empty(numLeaves, dtype=np.intp)
+		order   = np.arange(numLeaves)
+		for blockStart in range(0, numLeaves, blockSize):
+			blockEnd   = min(numLeaves, blockStart + blockSize)
+			lengthSums = np.zeros((blockEnd - blockStart, numLeaves), dtype=np.int64)
+			squareSums = np.zeros((blockEnd - blockStart, numLeaves), dtype=np.int64)
+
+			for positions, leafDepths, ancestorDepths in self.trees:
+				# The position in the tree of each leaf of the shared index
+				inverse[positions] = order
+				pathLengths = getPathLengths(leafDepths, ancestorDepths, inverse[blockStart:blockEnd])[:, inverse]
+				lengthSums += pathLengths
+				squareSums += np.square(pathLengths, dtype=np.int64)
+
+			meanLengths = lengthSums / self.numTrees
+			variances   = np.maximum(squareSums / self.numTrees - meanLengths * meanLengths, 0)
+			meanLengths[np.arange(blockEnd - blockStart), np.arange(blockStart, blockEnd)] = 1
+
+			variations = np.sqrt(variances) / meanLengths
+			instabilities[blockStart:blockEnd] = variations.sum(axis=1) / (numLeaves - 1)
+
+		return instabilities
+
+	def getConsensusCladeSizes(self):
+		# The number of leaves of the smallest clade of the majority rule consensus that
+		# contains the leaf, a rogue sits in a large multifurcation of the consensus.
+		# The leaves of each majority bipartition come from the first tree with it.
+		numLeaves = len(self.leafNames)
+		cladeSizes = np.full(numLeaves, numLeaves)
+		missing = self.majority
+		for (positions, leafDepths, ancestorDepths), (hashes, clusterStarts, clusterEnds) in zip(self.trees, self.clusters):
+			if len(missing) == 0:
+				break
+
+			isFound = np.isin(hashes, missing)
+			missing = np.setdiff1d(missing, hashes[isFound], assume_unique=True)
+			for clusterStart, clusterEnd in zip(clusterStarts[isFound].tolist(), clusterEnds[isFound].tolist()):
+				# Each bipartition as the side without the first leaf, then as its smaller side
+				clade = np.zeros(numLeaves, dtype=bool)
+				clade[positions[clusterStart:clusterEnd]] = True
+				if clade[0]:
+					clade = ~clade
+				size = np.count_nonzero(clade)
+				if size > numLeaves / 2:
+					clade = ~clade
+					size  = numLeaves - size
+
+				cladeSizes[clade] = np.minimum(cladeSizes[clade], size)
+
+		return cladeSizes
+
+###############################################################################
+def getRobustZScores(values):
+	median = np.median(values)
+	deviation = 1.4826 * np.median(np.abs(values - median))
+	if deviation == 0:
+		deviation = np.mean(np.abs(values - median)) * 1.2533
+	if deviation == 0:
+		return np.zeros(len(values))
+
+	return (values - median) / deviation
+
+###############################################################################
+def writePrunedTrees(treeFile, prunedFile, candidates):
+	# Writes the topologies without the candidates, inner nodes left with
+	# one child are removed. Kept on a stack, deep trees need no recursion.
+	with open(treeFile, "r") as treesIn, open(prunedFile, "w") as treesOut:
+		for line in treesIn:
+			if line.strip() == "":
+				continue
+
+			stack    = [[]]
+			previous = ""
+			label    = ""
+			for match in newickTokenPattern.finditer(line):
+				token = match.group()
+				if token in "(),;":
+					if label.strip() != "" and previous in ("(", ",", ""):
+						if getLeafName(label) not in candidates:
+							stack[-1].append(getLeafLabel(label))
+					label = ""
+
+					if token == "(":
+						stack.append([])
+					elif token == ")":
+						children = stack.pop()
+						if len(children) == 1:
+							stack[-1].append(children[0])
+						elif len(children) > 1:
+							stack[-1].append("(" + ",".join(children) + ")")
+					elif token == ";":
+						break
+
+					previous = token
+				else:
+					label += token
+
+			root = stack[0][0] if len(stack[0]) > 0 else "()"
+			treesOut.write(root + ";\n")
+
+###############################################################################
+def rankLeaves(treeFile, outPrefix, zScore, minRatio, maxCandidates, prunedTrees):
+	trees = TreeSet(treeFile)
+
+	instabilities = trees.getInstabilities()
+	zScores       = getRobustZScores(instabilities)
+	cladeSizes    = trees.getConsensusCladeSizes()
+
+	# Without rogues the instabilities are close to each other, so the
+	# leaves of the tail must also be far away from the median
+	median = np.median(instabilities)
+	ratios = instabilities / median if median > 0 else np.where(instabilities > 0, np.inf, 1.0)
+
+	ranking    = np.argsort(-instabilities, kind="stable")
+	candidates = [i for i in ranking if zScores[i] > zScore and ratios[i] >= minRatio]
+	if maxCandidates > 0:
+		candidates = candidates[:maxCandidates]
+	isCandidate = set(candidates)
+
+	print("Trees:", trees.numTrees, "leaves:", len(trees.leafNames), "bipartitions:", trees.numBipartitions, "rogue candidates:", len(candidates))
+
+	with open(outPrefix + ".tsv", "w") as rankingOut:
+		rankingOut.write("Rank\tLeaf\tInstability\tRobustZScore\tMedianRatio\tConsensusCladeSize\tCandidate\n")
+		for rank, i in enumerate(ranking):
+			rankingOut.write("\t".join([str(rank + 1), trees.leafNames[i], f"{instabilities[i]:.6f}", f"{zScores[i]:.3f}", f"{ratios[i]:.3f}", str(cladeSizes[i]), "yes" if i in isCandidate else "no"]) + "\n")
+
+	with open(outPrefix + ".candidates.txt", "w") as candidatesOut:
+		for i in candidates:
+			candidatesOut.write(trees.leafNames[i] + "\n")
+
+	if prunedTrees != "":
+		writePrunedTrees(treeFile, prunedTrees, set(trees.leafNames[i] for i in candidates))
+
+	return [trees.leafNames[i] for i in candidates]
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	infile, outPrefix, zScore, minRatio, maxCandidates, prunedTrees = parseArgs(sys.argv[0], sys.argv[1:])
+	rankLeaves(infile, outPrefix, zScore, minRatio, maxCandidates, prunedTrees)
+
+###############################################################################
@@ -1,19 +1,35 @@
 #!/bin/python3
 
 from ete3 import Tree, NexmlTree, nexml, faces, AttrFace, TextFace, RectFace, SeqMotifFace, PieChartFace, TreeStyle, NodeStyle
+import bisect # Find the id of a position in the joined ids
 import csv
+import hashlib # Key of the reference alignment map
+import re
+import sqlite3 # Genus lineage index
 from inspect import getmembers
-from Bio import AlignIO, Align
 
 import os # Strip extension from file
 import sys, getopt # Parse program arguments
+import glob # Expand input tree patterns in batch mode
+import multiprocessing # Worker pool for batch mode
+import traceback
+import json # Job requests of the daemon, profiles
+import resource # Profiling
+import time
+import signal
+import socket # Daemon mode
+import select
+import tempfile
 
-# Sequence logo
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
-import logomaker as logomaker
+
+# The modules for the sequence logos are imported by importLogoModules,
+# and Biopython where it is used, since importing them takes more time
+# than processing a small part tree
+pd        = None
+plt       = None
+mcolors   = None
+logomaker = None
 
 # Debugging
 import logging
@@ -43,6 +59,9 @@ type_ingroup  = 4
 type_outgroup = 5
 type_unknown  = 6
 
+# Leaf attributes counted by annotateLeafCounts
+countedAttributes = ['specialAA', 'taxonOfInterest']
+
 # Global maps
 aminoAcidColorMap       = {}
 aminoAcidTreeColorMap   = {}
@@ -52,6 +71,93 @@ genusInterestingTaxaMap = {}
 # Global variable (not nice, but the easy way)
 taxonPercentsFile = None
 
+# Clade members by clade tree file, see loadCladeMembers
+cladeMembersCache = {}
+
+# The shared data of the last job with the state of the files it was loaded
+# from, the daemon only loads it again if the files changed, see loadSharedData
+sharedDataKeys      = {}
+sharedAlignmentData = {}
+
+# The profiler of the current tree, set with --profile, see startStage
+profiler = None
+
+genusDatabase      = "SpeciesDatabase/GenusLinage.csv"
+genusDatabaseIndex = "SpeciesDatabase/GenusLinage.sqlite"
+
+###############################################################################
+class StageProfiler:
+	# Measures the stages of a tree one after the other, a stage
+	# ends when the next starts. Memory is in MB, the peak resident set
+	# size of this process during the stage, on Linux the high water mark
+	# is reset at the start of each stage, elsewhere it is the peak so far.
+	# The peak of the children cannot be reset, so only its growth
+	# during the stage is given.
+	def __init__(self):
+		self.stages  = []
+		self.current = None
+
+	def getUsage(self):
+		return time.perf_counter(), resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+
+	def resetPeakRSS(self):
+		# Writing 5 to clear_refs resets VmHWM to the current resident set size
+		try:
+			with open("/proc/self/clear_refs", "w") as clearRefs:
+				clearRefs.write("5")
+			return True
+		except OSError:
+			return False
+
+	def getPeakRSS(self, usageSelf, stagePeak):
+		if stagePeak:
+			try:
+				with open("/proc/self/status", "r") as status:
+					for line in status:
+						if line.startswith("VmHWM:"):
+							return int(line.split()[1]) / 1024
+			except OSError:
+				pass
+
+		return usageSelf.ru_maxrss / 1024
+
+	def start(self, stage):
+		self.stop()
+		stagePeak = self.resetPeakRSS()
+		self.current = (stage, stagePeak, self.getUsage())
+
+	def stop(self):
+		if self.current == None:
+			return
+
+		stage, stagePeak, (startWall, startSelf, startChildren) = self.current
+		wall, usageSelf, usageChildren = self.getUsage()
+		self.stages.append({
+			"stage":              stage,
+			"wallTime":           wall - startWall,
+			"cpuTime":            (usageSelf.ru_utime + usageSelf.ru_stime) - (startSelf.ru_utime + startSelf.ru_stime),
+			"childCpuTime":       (usageChildren.ru_utime + usageChildren.ru_stime) - (startChildren.ru_utime + startChildren.ru_stime),
+			"peakRSS":            self.getPeakRSS(usageSelf, stagePeak),
+			"childPeakRSSGrowth": (usageChildren.ru_maxrss - startChildren.ru_maxrss) / 1024
+		})
+		self.current = None
+
+	def reset(self):
+		self.stages  = []
+		self.current = None
+
+	def save(self, profileFile, inputTree):
+		self.stop()
+		with open(profileFile, "w") as profileOut:
+			json.dump({"tree": inputTree, "stages": self.stages}, profileOut, indent="\t")
+			profileOut.write("\n")
+
+###############################################################################
+def startStage(stage):
+	# Does nothing unless --profile is given
+	if profiler != None:
+		profiler.start(stage)
+
 ###############################################################################
 class ColorData:
 	def __init__(self, color, entryType, rank):
@@ -75,6 +181,69 @@ class Clade:
 		print("SeqID:", self.typeSeqID)
 		print("Name:", self.name)
 
+###############################################################################
+class MultiPatternMatcher:
+	# Finds all patterns in a text in a single pass. The patterns are compiled
+	# into a trie shaped regular expression, which reports at each position of
+	# the text the longest matching pattern. The shorter patterns matching at
+	# the same position are prefixes of it and are looked up from a table.
+	def __init__(self, patterns, values):
+		self.patternIndices = {}
+		self.values         = []
+		for pattern, value in zip(patterns, values):
+			self.patternIndices[pattern] = len(self.values)
+			self.values.append(value)
+
+		self.prefixIndices = {}
+		for pattern in self.patternIndices:
+			self.prefixIndices[pattern] = [index for prefix, index in self.patternIndices.items() if pattern.startswith(prefix)]
+
+		trie = {}
+		for pattern in self.patternIndices:
+			node = trie
+			for char in pattern:
+				node = node.setdefault(char, {})
+			node[""] = {}
+
+		if len(self.patternIndices) > 0:
+			self.regex = re.compile("(?=(" + self.trieToRegex(trie) + "))")
+		else:
+			self.regex = None
+
+	def trieToRegex(self, trie):
+		isEnd    = "" in trie
+		branches = [re.escape(char) + self.trieToRegex(subTrie) for char, subTrie in trie.items() if char != ""]
+
+		if len(branches) == 0:
+			return ""
+
+		if len(branches) == 1 and not isEnd:
+			return branches[0]
+
+		# The optional group is greedy, so the longer pattern is preferred
+		regex = "(?:" + "|".join(branches) + ")"
+		if isEnd:
+			regex += "?"
+
+		return regex
+
+	def findAll(self, text):
+		indices = set()
+		if self.regex:
+			for pattern in self.regex.findall(text):
+				indices.update(self.prefixIndices[pattern])
+
+		return indices
+
+	def findLast(self, text):
+		# Returns the value of the matching pattern that was given last,
+		# this is the one that won when all patterns were checked in order
+		indices = self.findAll(text)
+		if len(indices) == 0:
+			return None
+
+		return self.values[max(indices)]
+
 ###############################################################################
 class ConfigData:
 	def __init__(self, configFileName):
@@ -137,69 +306,211 @@ class ConfigData:
 			pass
 
 	def setAlignmentData(self, alignmentData):
+		from Bio import AlignIO
+
 		self.alignmentData = alignmentData
 		self.refSequence = AlignIO.read(self.refSeqFileName, "fasta")
 
-		for record in self.alignmentData.masterAlignment:
-			if self.refSequence[0].id in record.id:
+		row = self.alignmentData.findRowContaining(self.refSequence[0].id)
+		if row >= 0:
+			self.refRecord = self.alignmentData.getSequence(row)
+
+		# The reference sequence and its record are the same for all trees of a master
+		# alignment, so the map is stored next to it and only made again if one changes
+		refAlignmentMapFile = self.alignmentData.alnFile + "." + os.path.basename(self.refSeqFileName) + ".refMap.npz"
+		refAlignmentMapKey  = self.getRefAlignmentMapKey()
+		if not self.loadRefAlignmentMap(refAlignmentMapFile, refAlignmentMapKey):
+			self.alignRefSequence()
+			self.buildRefAlignmentMap()
+			self.saveRefAlignmentMap(refAlignmentMapFile, refAlignmentMapKey)
+
+		self.specialAminoAcidPosInAln    = self.getPosInRefAlignment(self.specialAminoAcidPos)
+		self.interestingAAPositionsInAln = self.getPositionsInRefAlignment(self.interestingAAPositions).tolist()
+		self.aaToHighlightInAln          = self.getPositionsInRefAlignment(self.aaToHighlight).tolist()
+
+	def alignRefSequence(self):
+		from Bio import Align
+
+		gapFreeRecord = self.refRecord.replace("-", "")
+		aligner = Align.PairwiseAligner()
+		aligner.mode = 'global'
+		self.refAlignment = aligner.align(str(self.refSequence[0].seq), gapFreeRecord)
+
+	def getRefAlignmentMapKey(self):
+		refHash = hashlib.sha256()
+		refHash.update(str(self.refSequence[0].seq).encode("ascii"))
+		refHash.update(b"\n")
+		refHash.update(self.refRecord.encode("ascii"))
+		return refHash.hexdigest()
+
+	def loadRefAlignmentMap(self, refAlignmentMapFile, refAlignmentMapKey):
+		if not os.path.isfile(refAlignmentMapFile):
+			return False
 
-				gapFreeRecord = record.seq.ungap()
-				aligner = Align.PairwiseAligner()
-				aligner.mode = 'global'
-				self.refAlignment = aligner.align(self.refSequence[0].seq, gapFreeRecord)
-				self.refRecord = record
-				break
+		try:
+			with np.load(refAlignmentMapFile) as refAlignmentMap:
+				if str(refAlignmentMap["key"]) != refAlignmentMapKey:
+					return False
+
+				self.refBlockEnds      = refAlignmentMap["blockEnds"]
+				self.refBlockGaps      = refAlignmentMap["blockGaps"]
+				self.refResidueColumns = refAlignmentMap["residueColumns"]
+		except (OSError, ValueError, KeyError) as err:
+			print("Cannot read " + refAlignmentMapFile + ", making it again:", err, file=sys.stderr)
+			return False
+
+		return True
+
+	def saveRefAlignmentMap(self, refAlignmentMapFile, refAlignmentMapKey):
+		# Write to a temporary file first, since parallel processes might read the map
+		tmpFile = refAlignmentMapFile + "." + str(os.getpid()) + ".tmp"
+		with open(tmpFile, "wb") as refAlignmentMapOut:
+			np.savez(refAlignmentMapOut, key=np.array(refAlignmentMapKey), blockEnds=self.refBlockEnds, blockGaps=self.refBlockGaps, residueColumns=self.refResidueColumns)
+
+		os.replace(tmpFile, refAlignmentMapFile)
+
+	def buildRefAlignmentMap(self):
+		# The number of unaligned reference residues up to each aligned block
+		# and the alignment columns of the residues of the master record, so
+		# that any number of positions is looked up without walking the
+		# alignment blocks and the record again
+		blocks = np.array(self.refAlignment[0].aligned[0], dtype=np.int64).reshape(-1, 2)
+		self.refBlockEnds = blocks[:, 1]
+		self.refBlockGaps = np.cumsum(blocks[:, 0] - np.concatenate(([0], blocks[:-1, 1])))
+
+		record = np.frombuffer(self.refRecord.encode("ascii"), dtype=np.uint8)
+		self.refResidueColumns = np.flatnonzero(record != ord("-"))
 
-		self.specialAminoAcidPosInAln = self.getPosInRefAlignment(self.specialAminoAcidPos)
+	def getPosInRefAlignment(self, pos):
+		return int(self.getPositionsInRefAlignment([pos])[0])
 
-		for pos in self.interestingAAPositions:
-			posInAln = self.getPosInRefAlignment(pos)
-			self.interestingAAPositionsInAln.append(posInAln)
+	def getPositionsInRefAlignment(self, positions):
+		positions = np.array(positions, dtype=np.int64)
 
-		for pos in self.aaToHighlight:
-			posInAln = self.getPosInRefAlignment(pos)
-			self.aaToHighlightInAln.append(posInAln)
+		# The first block that ends after the position or the last block
+		numGaps = np.zeros(len(positions), dtype=np.int64)
+		if len(self.refBlockEnds) > 0:
+			blockIndices = np.searchsorted(self.refBlockEnds, positions, side='right')
+			numGaps = self.refBlockGaps[np.minimum(blockIndices, len(self.refBlockEnds) - 1)]
 
-	def getPosInRefAlignment(self, pos):
-		lastPos = 0
-		thisPos = 0
-		numGaps = 0
-		for pair in self.refAlignment[0].aligned[0]:
-			thisPos  = pair[0]
-			numGaps += thisPos - lastPos
-			lastPos  = pair[1]
-			if lastPos > pos:
-				break
+		# Positions are one indexed, -1 for positions not in the master record
+		residueIndices = positions - numGaps - 1
+		found = (residueIndices >= 0) & (residueIndices < len(self.refResidueColumns))
 
-		i = 0
-		aaIndex = numGaps + 1 # This is zero indexed but pos is one indexed, so add one to account for that
-		while i < len(self.refRecord):
-			if self.refRecord[i] == "-":
-				i += 1
-				continue
+		posInAln = np.full(len(positions), -1, dtype=np.int64)
+		posInAln[found] = self.refResidueColumns[residueIndices[found]]
+		return posInAln
 
-			if aaIndex == pos:
-				return i
+	def getAlignmentLength(self):
+		return self.alignmentData.getAlignmentLength()
 
-			aaIndex += 1
-			i += 1
+###############################################################################
+def getAlignmentFile(inputTree, cladeTreeFile):
+	isFullTree = (cladeTreeFile == "")
 
-		return -1
+	if isFullTree:
+		return os.path.splitext(inputTree)[0]
+	else:
+		return os.path.splitext(os.path.splitext(os.path.splitext(cladeTreeFile)[0])[0])[0]
 
-	def getAlignmentLength(self):
-		return self.alignmentData.masterAlignment.get_alignment_length()
+###############################################################################
+def getSharedAlignmentData(inputTree, cladeTreeFile):
+	# The part trees of a master tree share its alignment, so it is
+	# kept for the next job as long as the alignment does not change
+	alnFile = os.path.abspath(getAlignmentFile(inputTree, cladeTreeFile))
+	key     = getFilesKey([alnFile])
+	if alnFile in sharedAlignmentData and sharedAlignmentData[alnFile][0] == key:
+		return sharedAlignmentData[alnFile][1]
+
+	alignmentData = AlignmentData(inputTree, cladeTreeFile)
+	sharedAlignmentData[alnFile] = (key, alignmentData)
+	return alignmentData
 
 ###############################################################################
 class AlignmentData:
-	def __init__(self, cladeTreeFile):
-		isFullTree = (cladeTreeFile == "")
+	def __init__(self, inputTree, cladeTreeFile):
+		alnFile = getAlignmentFile(inputTree, cladeTreeFile)
 
-		if isFullTree:
-			alnFile = os.path.splitext(inputTree)[0]
-		else:
-			alnFile = os.path.splitext(os.path.splitext(os.path.splitext(cladeTreeFile)[0])[0])[0]
+		# The master alignment is stored as a matrix of residues next to the alignment,
+		# all processes map the same file into memory instead of parsing the alignment
+		residuesFile = alnFile + ".residues.npy"
+		idsFile      = alnFile + ".ids.txt"
+		self.alnFile = alnFile
+
+		if not self.isCacheUpToDate(alnFile, residuesFile, idsFile):
+			self.writeCache(alnFile, residuesFile, idsFile)
+
+		with open(idsFile, "r") as ids:
+			self.ids = ids.read().splitlines()
 
-		self.masterAlignment = AlignIO.read(alnFile, "phylip-relaxed")
+		self.residues = np.load(residuesFile, mmap_mode="r")
+
+		# Built on first use
+		self.rowMap    = None
+		self.joinedIds = None
+		self.idOffsets = None
+
+	def isCacheUpToDate(self, alnFile, residuesFile, idsFile):
+		for cacheFile in [residuesFile, idsFile]:
+			if not os.path.isfile(cacheFile):
+				return False
+			if os.path.getmtime(cacheFile) < os.path.getmtime(alnFile):
+				return False
+
+		return True
+
+	def writeCache(self, alnFile, residuesFile, idsFile):
+		from Bio import AlignIO
+
+		masterAlignment = AlignIO.read(alnFile, "phylip-relaxed")
+
+		ids      = [record.id for record in masterAlignment]
+		residues = "".join([str(record.seq) for record in masterAlignment]).encode("ascii")
+		residues = np.frombuffer(residues, dtype=np.uint8).reshape(len(ids), masterAlignment.get_alignment_length())
+
+		# Write to temporary files first, since parallel processes might read the cache
+		tmpSuffix = "." + str(os.getpid()) + ".tmp"
+		with open(idsFile + tmpSuffix, "w") as idsOut:
+			for seqId in ids:
+				idsOut.write(seqId + "\n")
+		with open(residuesFile + tmpSuffix, "wb") as residuesOut:
+			np.save(residuesOut, residues)
+
+		os.replace(idsFile + tmpSuffix, idsFile)
+		os.replace(residuesFile + tmpSuffix, residuesFile)
+
+	def getAlignmentLength(self):
+		return self.residues.shape[1]
+
+	def getRowMap(self):
+		# For duplicated ids the last row wins
+		if self.rowMap == None:
+			self.rowMap = {seqId: row for row, seqId in enumerate(self.ids)}
+
+		return self.rowMap
+
+	def findRowContaining(self, text):
+		# Returns the first row whose id contains the text or -1. All ids are
+		# joined by new lines, so that one search covers all of them.
+		if self.joinedIds == None:
+			self.joinedIds = "\n".join(self.ids)
+			self.idOffsets = []
+			offset = 0
+			for seqId in self.ids:
+				self.idOffsets.append(offset)
+				offset += len(seqId) + 1
+
+		index = self.joinedIds.find(text)
+		if index < 0:
+			return -1
+
+		return bisect.bisect_right(self.idOffsets, index) - 1
+
+	def getSequence(self, row):
+		return self.residues[row].tobytes().decode("ascii")
+
+	def getResidues(self, row, columns):
+		return self.residues[row, columns].tobytes().decode("ascii")
 
 ###############################################################################
 def hasSpecialAA():
@@ -212,6 +523,10 @@ def hasTaxa():
 ###############################################################################
 def countAttributes(tree, attribute):
 
+	# Use the counts from annotateLeafCounts if they are there
+	if hasattr(tree, 'attributeCounts'):
+		return tree.attributeCounts[attribute], tree.numLeaves
+
 	countMap = {}
 	numLeaves = 0
 	for leaf in tree.iter_leaves():
@@ -277,8 +592,58 @@ def getAminoAcidColorScheme():
 
 	return colorScheme
 
+###############################################################################
+def getCladeRows(clade, sequenceMap):
+	return [sequenceMap[leaf.name] for leaf in clade.rootNode.iter_leaves() if leaf.name in sequenceMap]
+
+###############################################################################
+def countResiduesOfClades(alignmentData, cladeRows, columns):
+	# Count the residues at the given columns for all clades at once, instead
+	# of making a string per sequence and a count matrix per clade.
+	# Returns the residues found and the counts per clade, column, and residue.
+	numClades  = len(cladeRows)
+	numColumns = len(columns)
+
+	rows       = np.array([row for rows in cladeRows for row in rows], dtype=np.int64)
+	cladeIndex = np.repeat(np.arange(numClades), [len(rows) for rows in cladeRows])
+
+	residues = alignmentData.residues[np.ix_(rows, np.array(columns, dtype=np.int64))]
+	chars, codes = np.unique(residues, return_inverse=True)
+	codes = codes.reshape(residues.shape)
+
+	# One key per clade, column, and residue, so that one bincount counts everything
+	keys = (cladeIndex[:, np.newaxis] * numColumns + np.arange(numColumns)) * len(chars) + codes
+	counts = np.bincount(keys.ravel(), minlength=numClades * numColumns * len(chars))
+
+	return chars, counts.reshape(numClades, numColumns, len(chars))
+
+###############################################################################
+def getCountMatrix(chars, counts, numSeqs):
+	# Gives the same matrix as logomaker.alignment_to_matrix for the sequences,
+	# including the errors, which are printed instead of the logo
+	if numSeqs == 0:
+		raise ValueError("sequences must have length > 0.")
+
+	present = [j for j in range(len(chars)) if counts[:, j].sum() > 0 and chr(chars[j]) not in ".-"]
+	countMatrix = pd.DataFrame(counts[:, present], columns=[chr(chars[j]) for j in present])
+
+	return logomaker.transform_matrix(countMatrix, from_type='counts', to_type='counts')
+
+###############################################################################
+def importLogoModules():
+	global pd, plt, mcolors, logomaker
+
+	import pandas as pd
+	import matplotlib
+	# The figures are only saved to files, so no display is needed
+	matplotlib.use("Agg")
+	import matplotlib.pyplot as plt
+	import matplotlib.colors as mcolors
+	import logomaker as logomaker
+
 ###############################################################################
 def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
+	importLogoModules()
 
 	spacing = 5
 	minPos = refSeqConfigData.specialAminoAcidPos - refSeqConfigData.toLowerLimit
@@ -313,22 +678,22 @@ def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
 	# Make figure
 	logoFigure = plt.figure(figsize=[colWidth * numCols, rowHeight * numClades])
 
-	sequenceMap = {}
-	for record in refSeqConfigData.alignmentData.masterAlignment:
-		sequenceMap[record.id] = record
+	alignmentData = refSeqConfigData.alignmentData
+	sequenceMap = alignmentData.getRowMap()
 
 	colorScheme = getAminoAcidColorScheme()
 	sortedClades = getSortedClades(tree, clades)
+
+	# Count the residues for both logos at once
+	cladeRows = [getCladeRows(clade, sequenceMap) for clade in sortedClades]
+	logoColumns = list(range(lowerLimit, upperLimit)) + list(refSeqConfigData.interestingAAPositionsInAln)
+	chars, counts = countResiduesOfClades(alignmentData, cladeRows, logoColumns)
+	numWindowColumns = upperLimit - lowerLimit
+
 	i = 0
 	for clade in sortedClades:
 
-		sequences = []
-		numSeqs = 0
-		for leaf in clade.rootNode.iter_leaves():
-			if leaf.name in sequenceMap:
-				record = sequenceMap[leaf.name]
-				sequences.append(str(record.seq[lowerLimit:upperLimit]))
-				numSeqs += 1
+		numSeqs = len(cladeRows[i])
 
 		print("Make " + str(i+1) + ". of " + str(numClades) + " SeqLogos for the clade " + clade.name, file=sys.stderr)
 
@@ -377,7 +742,7 @@ def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
 			ax.set_xticks([])
 
 		try:
-			dataMatrix = logomaker.alignment_to_matrix(sequences)
+			dataMatrix = getCountMatrix(chars, counts[i, :numWindowColumns], numSeqs)
 			seqLogo = logomaker.Logo(dataMatrix, ax=ax, color_scheme=colorScheme)
 
 			j = 0
@@ -418,14 +783,7 @@ def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
 	i = 0
 	for clade in sortedClades:
 
-		sequences = []
-		numSeqs = 0
-		for leaf in clade.rootNode.iter_leaves():
-			if leaf.name in sequenceMap:
-				record = sequenceMap[leaf.name]
-				seq = ''.join([ record.seq[i] for i in refSeqConfigData.interestingAAPositionsInAln])
-				sequences.append(seq)
-				numSeqs += 1
+		numSeqs = len(cladeRows[i])
 
 		print("Make " + str(i+1) + ". of " + str(numClades) + " SingleSeqLogos for the clade " + clade.name, file=sys.stderr)
 
@@ -474,7 +832,7 @@ def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
 			ax.set_xticks([])
 
 		try:
-			dataMatrix = logomaker.alignment_to_matrix(sequences)
+			dataMatrix = getCountMatrix(chars, counts[i, numWindowColumns:], numSeqs)
 			seqLogo = logomaker.Logo(dataMatrix, ax=ax, color_scheme=colorScheme)
 			if clade == sortedClades[-1]:
 				seqLogo.style_xticks(anchor=0, spacing=1, rotation=270)
@@ -496,15 +854,13 @@ def makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase):
 ###############################################################################
 def sortMasterAlignment(tree, alignmentData, sortedAlignmentFile):
 
-	sequenceMap = {}
-	for record in alignmentData.masterAlignment:
-		sequenceMap[record.id] = record
+	sequenceMap = alignmentData.getRowMap()
 
 	with open(sortedAlignmentFile, "w") as outFile:
 		for leaf in tree.iter_leaves():
 			if leaf.name != "" and leaf.name in sequenceMap:
 				outFile.write(">" + leaf.name + "\n")
-				outFile.write(str(sequenceMap[leaf.name].seq) + "\n")
+				outFile.write(alignmentData.getSequence(sequenceMap[leaf.name]) + "\n")
 
 
 ###############################################################################
@@ -513,14 +869,13 @@ def determineSpecialAminoAcidsAtPos(tree, refSeqConfigData):
 	if refSeqConfigData.specialAminoAcidPosInAln < 0:
 		return
 
-	sequenceMap = {}
-	for record in refSeqConfigData.alignmentData.masterAlignment:
-		sequenceMap[record.id] = record
+	alignmentData = refSeqConfigData.alignmentData
+	sequenceMap = alignmentData.getRowMap()
 
 	for leaf in tree.iter_leaves():
 		if leaf.name in sequenceMap:
-			record = sequenceMap[leaf.name]
-			leaf.specialAA = record[refSeqConfigData.specialAminoAcidPosInAln].upper()
+			row = sequenceMap[leaf.name]
+			leaf.specialAA = alignmentData.getResidues(row, refSeqConfigData.specialAminoAcidPosInAln).upper()
 
 ###############################################################################
 def loadColorMap(colorFile, colorMap):
@@ -561,8 +916,37 @@ def loadColorMap(colorFile, colorMap):
 
 		colorMap["_"] = ColorData("Black", type_regular, 0)
 
+###############################################################################
+def annotateLeafCounts(tree):
+	# Stores on every node the number of its leaves and how often each value
+	# of the counted attributes occurs among them in one bottom up traversal,
+	# so that the layouts do not iterate over the leaves of each node again.
+	# The counts are in the order of the first leaf with that value, as if
+	# counted by countAttributes. Must be called after the last reroot.
+	for node in tree.traverse("postorder"):
+		if node.is_leaf():
+			node.numLeaves = 1
+			node.attributeCounts = {}
+			for attribute in countedAttributes:
+				node.attributeCounts[attribute] = {getattr(node, attribute, "_"): 1}
+		else:
+			node.numLeaves = 0
+			node.attributeCounts = {}
+			for attribute in countedAttributes:
+				node.attributeCounts[attribute] = {}
+
+			for child in node.children:
+				node.numLeaves += child.numLeaves
+				for attribute in countedAttributes:
+					countMap = node.attributeCounts[attribute]
+					for key, value in child.attributeCounts[attribute].items():
+						countMap[key] = countMap.get(key, 0) + value
+
 ###############################################################################
 def countLeaves(tree):
+	if hasattr(tree, 'numLeaves'):
+		return tree.numLeaves
+
 	numLeaves = 0
 	for leaf in tree.iter_leaves():
 		numLeaves += 1
@@ -570,72 +954,67 @@ def countLeaves(tree):
 	return numLeaves
 
 ###############################################################################
-def getSupportOverThresholdColor(supports):
-	supportValues = supports.split("/")
-	if len(supportValues) > 2:
-		try:
-			if(float(supportValues[0])         >= SHaLRTThresholds[0] and
-			   float(supportValues[1]) * 100.0 >= aBayesThresholds[0] and
-			     int(supportValues[2])         >= UFBootThresholds[0]):
-				return 'Black'
-		except ValueError:
-			pass
-	else:
-		try:
-			if(  int(supportValues[0]) > UFBootThresholds[0]):
-				return 'Black'
-		except ValueError:
-			pass
+def parseSupportValues(name):
+	# The SH-aLRT, the aBayes in percent, and the UFBoot value of a node label, or
+	# only the UFBoot value if the label has less than three parts, or nothing
+	supportValues = name.split("/")
+	try:
+		if len(supportValues) > 2:
+			return [float(supportValues[0]), float(supportValues[1]) * 100, int(supportValues[2])]
 
-	return 'Gray'
+		return [int(supportValues[0])]
+	except ValueError:
+		return []
 
 ###############################################################################
-def addSupportPieCharts(node, columnNum):
-	supports = node.name
-	supportValues = supports.split("/")
-
-	if len(supportValues) > 2:
-		try:
-			SHaLRTValue = float(supportValues[0])
-			aBayesValue = float(supportValues[1]) * 100
-			UFBootValue =   int(supportValues[2])
+def annotateSupportValues(tree):
+	# Parses the support labels of all nodes once and compares them with the
+	# thresholds in one pass over all nodes, the layouts only look up the results.
+	# Must be called after the last change of the node names by nameCladeRoots.
+	nodes = list(tree.traverse())
+	supportValues = [parseSupportValues(node.name) for node in nodes]
+
+	# One row per node with the SH-aLRT, aBayes, and UFBoot value, missing values are NaN
+	supportArray = np.full((len(nodes), 3), np.nan)
+	isTriplet = np.array([len(values) == 3 for values in supportValues], dtype=bool)
+	for i, values in enumerate(supportValues):
+		supportArray[i, 3 - len(values):] = values
+
+	# The index of the color of each value in colorThresholds, the first threshold
+	# the value reaches, or the last color before the empty color
+	thresholds = np.array([SHaLRTThresholds, aBayesThresholds, UFBootThresholds], dtype=float)
+	colorIndices = np.full(supportArray.shape, 3)
+	for level in reversed(range(3)):
+		colorIndices[supportArray >= thresholds[:, level]] = level
+
+	# A label is drawn black if all three values reach their first threshold,
+	# a UFBoot value alone must be over its first threshold
+	isOverThreshold = np.where(isTriplet, np.all(supportArray >= thresholds[:, 0], axis=1), supportArray[:, 2] > UFBootThresholds[0])
+
+	for i, node in enumerate(nodes):
+		node.supportValues = supportValues[i]
+		node.supportColor  = 'Black' if isOverThreshold[i] else 'Gray'
+		node.supportPies  = [(value, colorThresholds[colorIndex]) for value, colorIndex in zip(supportValues[i], colorIndices[i, 3 - len(supportValues[i]):])]
 
-			columnNum = addOneSupportPieChart(node, columnNum, SHaLRTValue, SHaLRTThresholds)
-			columnNum = addOneSupportPieChart(node, columnNum, aBayesValue, aBayesThresholds)
-			columnNum = addOneSupportPieChart(node, columnNum, UFBootValue, UFBootThresholds)
-
-			return columnNum
+###############################################################################
+def addSupportPieCharts(node, columnNum):
+	if len(node.supportPies) == 0:
+		return 0
 
-		except ValueError:
-			pass
-	elif len(supportValues) > 0:
-		try:
-			UFBootValue = int(supportValues[0])
-			return addOneSupportPieChart(node, columnNum, UFBootValue, UFBootThresholds)
-		except ValueError:
-			pass
+	for value, color in node.supportPies:
+		columnNum = addOneSupportPieChart(node, columnNum, value, color)
 
-	return 0
+	return columnNum
 
 ###############################################################################
-def addOneSupportPieChart(node, columnNum, value, thresholds):
-
-	if   value >= thresholds[0]:
-		color = colorThresholds[0]
-	elif value >= thresholds[1]:
-		color = colorThresholds[1]
-	elif value >= thresholds[2]:
-		color = colorThresholds[2]
-	else:
-		color = colorThresholds[3]
-
+def addOneSupportPieChart(node, columnNum, value, color):
 	colorEmpty = colorThresholds[-1]
 
 	percents = [value, 100.0 - value]
 	colors   = [color, colorEmpty]
 
 	pie_face = PieChartFace(percents, 10, 10, colors)
-	node.add_face(pie_face, column=columnNum, position="branch-right")
+	faces.add_face_to_node(pie_face, node, column=columnNum, position="branch-right")
 	columnNum += 1
 	return columnNum
 
@@ -654,7 +1033,7 @@ def fullTreeLayout(node):
 
 			aa_face.margin_top = 2
 			aa_face.margin_bottom = 2
-			node.add_face(aa_face, column=columnNum, position="aligned")
+			faces.add_face_to_node(aa_face, node, column=columnNum, position="aligned")
 			columnNum += 1
 
 		if hasTaxa():
@@ -667,7 +1046,7 @@ def fullTreeLayout(node):
 
 			it_face.margin_top = 2
 			it_face.margin_bottom = 2
-			node.add_face(it_face, column=columnNum, position="aligned")
+			faces.add_face_to_node(it_face, node, column=columnNum, position="aligned")
 			columnNum += 1
 
 		# If terminal node, draw its name
@@ -681,18 +1060,18 @@ def fullTreeLayout(node):
 			name_face.margin_top = 2
 			name_face.margin_bottom = 2
 		# Add the name face to the image at the preferred position
-		node.add_face(name_face, column=columnNum, position="aligned")
+		faces.add_face_to_node(name_face, node, column=columnNum, position="aligned")
 		columnNum += 1
 
 		rect_face = TextFace("                                            ")
 		rect_face.background.color = node.img_style["fgcolor"]
 		rect_face.margin_top = 2
 		rect_face.margin_bottom = 2
-		node.add_face(rect_face, column=columnNum, position="aligned")
+		faces.add_face_to_node(rect_face, node, column=columnNum, position="aligned")
 		columnNum += 1
 		if node.cladeName != "":
 			clade_face = TextFace(node.cladeName, fsize=100)
-			node.add_face(clade_face, column=columnNum, position="float-right")
+			faces.add_face_to_node(clade_face, node, column=columnNum, position="float-right")
 			columnNum += 1
 
 	elif not node.img_style["draw_descendants"]:
@@ -726,7 +1105,7 @@ def collapsedCompactTreeLayout(node):
 		rectFace = RectFace(lineWidth, lineWidth, "White", "White")
 		rectFace.margin_top    = margin
 		rectFace.margin_bottom = margin
-		node.add_face(rectFace, column=columnNum, position=pos)
+		faces.add_face_to_node(rectFace, node, column=columnNum, position=pos)
 	elif not node.img_style["draw_descendants"]:
 		# Technically this is an internal node
 		columnNum = addSupportPieCharts(node, 0)
@@ -748,7 +1127,7 @@ def collapsedSimpleTreeLayout(node):
 		name_face =  TextFace(" ")
 		name_face.margin_top = -2
 		# Add the name face to the image at the preferred position
-		node.add_face(name_face, column=columnNum, position=pos)
+		faces.add_face_to_node(name_face, node, column=columnNum, position=pos)
 	elif not node.img_style["draw_descendants"]:
 		# Technically this is an internal node
 		columnNum = addSupportPieCharts(node, 0)
@@ -766,7 +1145,7 @@ def collapsedSimpleNoSupportTreeLayout(node):
 		name_face =  TextFace(" ")
 		name_face.margin_top = -2
 		# Add the name face to the image at the preferred position
-		node.add_face(name_face, column=columnNum, position=pos)
+		faces.add_face_to_node(name_face, node, column=columnNum, position=pos)
 	elif not node.img_style["draw_descendants"]:
 		# Technically this is an internal node
 		columnNum = 0
@@ -784,7 +1163,7 @@ def collapsedLeafLayout(node, pos):
 
 	name_face.margin_top = -2
 	# Add the name face to the image at the preferred position
-	node.add_face(name_face, column=columnNum, position=pos)
+	faces.add_face_to_node(name_face, node, column=columnNum, position=pos)
 	columnNum += 1
 
 	if hasSpecialAA():
@@ -795,7 +1174,7 @@ def collapsedLeafLayout(node, pos):
 			aa_face = TextFace(" ")
 			aa_face.background.color = "Black"
 
-		node.add_face(aa_face, column=columnNum, position=pos)
+		faces.add_face_to_node(aa_face, node, column=columnNum, position=pos)
 		columnNum += 1
 
 	if hasTaxa():
@@ -808,11 +1187,11 @@ def collapsedLeafLayout(node, pos):
 
 		it_face.margin_top = 4
 		it_face.margin_bottom = 4
-		node.add_face(it_face, column=columnNum, position=pos)
+		faces.add_face_to_node(it_face, node, column=columnNum, position=pos)
 		columnNum += 1
 
 	if not node.img_style["draw_descendants"]:
-		node.add_face(TextFace(" " + node.cladeName), column=columnNum, position=pos)
+		faces.add_face_to_node(TextFace(" " + node.cladeName), node, column=columnNum, position=pos)
 		columnNum += 1
 
 ###############################################################################
@@ -826,14 +1205,14 @@ def collapsedSimpleNodeLayout(node, columnNum, marginLeft, doCountLeaves, pos):
 	seq_face = SeqMotifFace(motifs=simple_motifs)
 	seq_face.margin_left = marginLeft
 	seq_face.rotable = False
-	node.add_face(seq_face, column=columnNum, position="branch-right")
+	faces.add_face_to_node(seq_face, node, column=columnNum, position="branch-right")
 	columnNum += 1
 
 	numLeavesStr = (" - " + str(countLeaves(node)) + " ") if doCountLeaves else ""
 	faceText = " " + node.cladeName + numLeavesStr
 	name_face = TextFace(faceText)
 	# Add the name face to the image at the preferred position
-	node.add_face(name_face, column=columnNum, position=pos)
+	faces.add_face_to_node(name_face, node, column=columnNum, position=pos)
 	columnNum += 1
 
 	return columnNum, faceText
@@ -847,17 +1226,17 @@ def collapsedNodeLayout(node, columnNum, marginLeft, pos):
 		pie_face = PieChartFace(percents, 30, 30, colors)
 		pie_face.margin_top = 4
 		pie_face.margin_bottom = 4
-		node.add_face(pie_face, column=columnNum, position=pos)
+		faces.add_face_to_node(pie_face, node, column=columnNum, position=pos)
 		columnNum += 1
 
 	if hasTaxa():
-		node.add_face(TextFace(" ", fsize=10), column=columnNum, position=pos)
+		faces.add_face_to_node(TextFace(" ", fsize=10), node, column=columnNum, position=pos)
 		columnNum += 1
 		percents, colors, taxonLine = getColorsAndPercents(node, taxonColorMap, 'taxonOfInterest')
 		pie_face = PieChartFace(percents, 30, 30, colors)
 		pie_face.margin_top = 4
 		pie_face.margin_bottom = 4
-		node.add_face(pie_face, column=columnNum, position=pos)
+		faces.add_face_to_node(pie_face, node, column=columnNum, position=pos)
 		columnNum += 1
 
 		taxonPercentsFile.write(faceText + " " + taxonLine + "\n")
@@ -868,10 +1247,9 @@ def addSupportValues(node):
 		if node.name == "":
 			name_face = TextFace(" ", fsize=10)
 		else:
-			color = getSupportOverThresholdColor(node.name)
-			name_face = AttrFace("name", fsize=10, fgcolor=color)
+			name_face = AttrFace("name", fsize=10, fgcolor=node.supportColor)
 		# Add the name face to the image at the preferred position
-		node.add_face(name_face, column=0, position="branch-top")
+		faces.add_face_to_node(name_face, node, column=0, position="branch-top")
 
 ###############################################################################
 def colorNodes(node, cladeColor, cladeBackgroundTextColor):
@@ -914,9 +1292,13 @@ def initClades(tree):
 		node.cladeName = ""
 
 ###############################################################################
-def loadCladeInfo(tree, fileName, cladeTreeFile):
+def loadCladeInfo(leafMap, fileName, cladeTreeFile):
 	clades = []
 
+	cladeMembers = None
+	if cladeTreeFile != '':
+		cladeMembers = loadCladeMembers(cladeTreeFile)
+
 	with open(fileName, newline='') as cladeFile:
 		cladeReader = csv.reader(cladeFile, delimiter='\t')
 		for row in cladeReader:
@@ -931,7 +1313,7 @@ def loadCladeInfo(tree, fileName, cladeTreeFile):
 				continue
 
 			# Continue if the label is not among the nodes
-			leafNode = getLeaveOfClade(tree, row[0], row[1], cladeTreeFile)
+			leafNode = getLeaveOfClade(leafMap, row[0], row[1], cladeMembers)
 			if not leafNode:
 				continue
 
@@ -950,41 +1332,80 @@ def cladifyNodes(tree, clades):
 			node = node.up
 
 ###############################################################################
-def getLeaveOfClade(tree, cladeSeqId, cladeName, cladeTreeFile):
-	if cladeTreeFile == '':
-		node = tree.search_nodes(name=cladeSeqId)
-		if len(node) > 0:
-			return node[0]
+def getLeafMap(tree):
+	# The leaves stay the same node objects when the tree is rerooted
+	# with set_outgroup, so the map stays valid
+	leafMap = {}
+	for leaf in tree.iter_leaves():
+		if leaf.name not in leafMap:
+			leafMap[leaf.name] = leaf
+
+	return leafMap
+
+###############################################################################
+def getLeaveOfClade(leafMap, cladeSeqId, cladeName, cladeMembers):
+	if cladeMembers == None:
+		if cladeSeqId in leafMap:
+			return leafMap[cladeSeqId]
 		else:
 			return None
 	else:
-		node = tree.search_nodes(name=cladeSeqId)
-		if len(node) > 0:
-			return node[0]
+		if cladeSeqId in leafMap:
+			return leafMap[cladeSeqId]
 
 		# In the clade tree file parentheses are replaced by underscores
 		cladeName = cladeName.replace("(", "_")
 		cladeName = cladeName.replace(")", "_")
 
-		with open(cladeTreeFile, "r") as cladeTrees:
-			for line in cladeTrees:
-				subtree = Tree(line, format=3)
-				if subtree.name == cladeName:
-					collectedNodes = []
-					for leaf in subtree.iter_leaves():
-						nodeList = tree.get_leaves_by_name(leaf.name)
-						if len(nodeList) > 0:
-							collectedNodes.append(nodeList[0])
-
-					if len(collectedNodes) <= 0:
-						continue
+		if cladeName not in cladeMembers:
+			return None
+
+		for leafNames in cladeMembers[cladeName]:
+			collectedNodes = [leafMap[leafName] for leafName in leafNames if leafName in leafMap]
+
+			if len(collectedNodes) <= 0:
+				continue
 
-					middleNode = int((len(collectedNodes) - 1) / 2)
+			middleNode = int((len(collectedNodes) - 1) / 2)
 
-					return collectedNodes[middleNode]
+			return collectedNodes[middleNode]
 
 		return None
 
+###############################################################################
+def getCladeMembersFile(cladeTreeFile):
+	return os.path.splitext(cladeTreeFile)[0] + ".cladeMembers.tsv"
+
+###############################################################################
+def getNewickName(name):
+	# The Newick writer of ete3 replaces these characters by underscores
+	return re.sub("[:;(),\\[\\]\t\n\r=]", "_", name)
+
+###############################################################################
+def loadCladeMembers(cladeTreeFile):
+	# Maps each clade name, as in the clade tree file, to the lists of its leaf names,
+	# in the order of the clade tree file, the master tree run writes these into
+	# an index next to the clade tree file, for older runs it is made from the trees
+	cladeMembersFile = getCladeMembersFile(cladeTreeFile)
+	key = getFilesKey([cladeTreeFile, cladeMembersFile])
+	if key[0][0] in cladeMembersCache and cladeMembersCache[key[0][0]][0] == key:
+		return cladeMembersCache[key[0][0]][1]
+
+	cladeMembers = {}
+	if os.path.isfile(cladeMembersFile) and os.path.getmtime(cladeMembersFile) >= os.path.getmtime(cladeTreeFile):
+		with open(cladeMembersFile, "r") as cladeMembersIn:
+			for line in cladeMembersIn:
+				splitLine = line.rstrip("\n").split("\t")
+				cladeMembers.setdefault(splitLine[0], []).append(splitLine[1:])
+	else:
+		with open(cladeTreeFile, "r") as cladeTrees:
+			for line in cladeTrees:
+				subtree = Tree(line, format=3)
+				cladeMembers.setdefault(subtree.name, []).append([leaf.name for leaf in subtree.iter_leaves()])
+
+	cladeMembersCache[key[0][0]] = (key, cladeMembers)
+	return cladeMembers
+
 ###############################################################################
 def initialReroot(tree, clades):
 	clade = clades[-1] # Use the last clade for rooting
@@ -1023,9 +1444,7 @@ def getCladeRootNode(node):
 	
 ###############################################################################
 def assignCladeNameToCenterLeaf(node, cladeName):
-	counter = 0
-	for leaf in node.iter_leaves():
-		counter += 1
+	counter = countLeaves(node)
 
 	halfCounter = int(counter / 2)
 
@@ -1047,16 +1466,77 @@ def colorAndNameClades(tree, clades):
 
 ###############################################################################
 def saveCladesAsTrees(tree, clades, outputFile):
+	cladeMembers = []
 	with open(outputFile, "w") as outFile:
 		for clade in clades:
-			node = tree.search_nodes(name=clade.typeSeqID)[0]
-
 			tmpName = clade.rootNode.name
 			clade.rootNode.name = clade.name
 			outFile.write(clade.rootNode.write(format=3) + "\n")
 #			outFile.write("(" + clade.rootNode.write()[:-1] + ")" + clade.name + ";\n")
 			clade.rootNode.name = tmpName
 
+			# The clade names and leaf names as they are written to the clade tree file
+			leafNames = [getNewickName(leaf.name) for leaf in clade.rootNode.iter_leaves()]
+			cladeMembers.append(getNewickName(clade.name) + "\t" + "\t".join(leafNames) + "\n")
+
+	# The index is written after the clade tree file is closed, so that it is
+	# never older, see loadCladeMembers, and appears only when it is complete
+	cladeMembersFile = getCladeMembersFile(outputFile)
+	tmpFile = cladeMembersFile + "." + str(os.getpid()) + ".tmp"
+	with open(tmpFile, "w") as cladeMembersOut:
+		cladeMembersOut.writelines(cladeMembers)
+	os.replace(tmpFile, cladeMembersFile)
+
+###############################################################################
+def writeCladeSupport(tree, clades, outputFile):
+	# The clade roots are found with the clade counters of cladifyNodes, so in
+	# one pass each node belongs to the clade of its parent, unless it is a clade
+	# root itself. Needs the leaf counts and the parsed support values.
+	cladeOfRoot = {clade.rootNode: i for i, clade in enumerate(clades)}
+	rootDepths  = [0] * len(clades)
+	rootDists   = [0.0] * len(clades)
+	numInternal = [0] * len(clades)
+	cladeValues = [[[], [], []] for clade in clades]
+
+	# The clade, the depth, and the distance to the root of each node
+	nodeData = {}
+	for node in tree.traverse("preorder"):
+		if node.up == None:
+			cladeIndex, depth, dist = -1, 0, 0.0
+		else:
+			cladeIndex, depth, dist = nodeData[node.up]
+			depth += 1
+			dist  += node.dist
+
+		isCladeRoot = node in cladeOfRoot
+		if isCladeRoot:
+			cladeIndex = cladeOfRoot[node]
+			rootDepths[cladeIndex] = depth
+			rootDists[cladeIndex]  = dist
+
+		if cladeIndex >= 0 and not node.is_leaf():
+			numInternal[cladeIndex] += 1
+			# The values of the clade root are given separately
+			if not isCladeRoot:
+				for i, value in enumerate(node.supportValues, 3 - len(node.supportValues)):
+					cladeValues[cladeIndex][i].append(value)
+
+		nodeData[node] = (cladeIndex, depth, dist)
+
+	def getMeanAndMin(values, scale):
+		if len(values) == 0:
+			return ["NA", "NA"]
+		return [f"{sum(values) / len(values) / scale:.4f}", f"{min(values) / scale:.4f}"]
+
+	with open(outputFile, "w") as outFile:
+		outFile.write("Clade\tRootSupport\tNumLeaves\tDepth\tDistanceToRoot\tNumInternalNodes\tSHaLRTMean\tSHaLRTMin\taBayesMean\taBayesMin\tUFBootMean\tUFBootMin\n")
+		for i, clade in enumerate(clades):
+			rootNode = clade.rootNode
+			# aBayes is stored in percent, but written as in the tree file
+			supportColumns = getMeanAndMin(cladeValues[i][0], 1) + getMeanAndMin(cladeValues[i][1], 100) + getMeanAndMin(cladeValues[i][2], 1)
+			rootSupport = rootNode.name if not rootNode.is_leaf() and rootNode.name != "" else "NA"
+			outFile.write("\t".join([clade.name, rootSupport, str(rootNode.numLeaves), str(rootDepths[i]), f"{rootDists[i]:.6f}", str(numInternal[i])] + supportColumns) + "\n")
+
 ###############################################################################
 def nameCladeRoots(tree, clades):
 	for clade in clades:
@@ -1276,12 +1756,35 @@ def getLegendOnlyStyle(tree):
 
 	return ts
 
+###############################################################################
+class Options:
+	def __init__(self):
+		self.infile           = ""
+		self.infiles          = []
+		self.cladeFile        = ""
+		self.cladeTreeFile    = ""
+		self.refSeqConfigData = None
+		self.iterestingTaxa   = ""
+		self.customAA         = ""
+		self.additionalTaxa   = ""
+		self.makeLogos        = False
+		self.batch            = False
+		self.numJobs          = 0
+		self.reportFile       = ""
+		self.parallelRender   = False
+		self.headless         = False
+		self.serve            = False
+		self.socketFile       = ""
+		self.profile          = False
+
 ###############################################################################
 def usage(progName):
 	print(progName, "annotates a tree from a newick file with clades and draws a full")
 	print("version of the tree and a version with clades collapsed.\n")
 	print(' -h, --help                                Prints this help message.')
 	print(' -i, --infile              <infile>        The input file with the newick tree to visualize.')
+	print('                                           In batch mode this option can be given several times')
+	print('                                           and may be a quoted glob pattern, such as "dir/*.treefile".')
 	print(' -t, --trees               <cladetreefile> The tree file with the subclade trees to visualize input trees with sub data set.')
 	print(' -c, --cladefile           <cladefile>     The clade file, a tab separated list with a clade per line.')
 	print('                                           Each clade is defined by a leaf name, the clade name,')
@@ -1291,25 +1794,33 @@ def usage(progName):
 	print('                                           lysine at position 296 in cattle rhodopsin. This position is then displayed')
 	print('                                           on the trees and used for the sequence logo.')
 	print('                                           This option is ignored if configFile does not exist.')
+	print(' -b, --batch                               Process all input trees in one process. The shared input files are')
+	print('                                           loaded once and the trees are processed by a pool of workers.')
+	print(' -j, --jobs                <numJobs>       The maximum number of trees processed at the same time in batch mode,')
+	print('                                           or the maximum number of figures rendered at the same time with -p.')
+	print('                                           Default are the CPUs allocated by the scheduler or available.')
+	print(' -p, --parallelRender                      Renders the figures of a single tree and its sequence logos in parallel.')
+	print('                                           The tree is annotated once and handed to the workers. Ignored in batch mode.')
+	print(' -r, --report              <reportFile>    Writes for each tree of the batch a tab separated line with')
+	print('                                           the tree file, OK or FAILED, and the error message.')
+	print('     --headless                            Renders the trees with the offscreen platform of Qt, so that no')
+	print('                                           X server is needed. This is the default if no display is set.')
+	print('     --profile                             Writes the wall time, CPU time, and peak memory of each stage and figure')
+	print('                                           to a JSON file next to the figures, summarized by 12c_SummarizeProfiles.py.')
+	print('                                           In batch mode the loading of the shared data is written next to the report.')
+	print('     --serve                               Runs as daemon that keeps the shared input files loaded and')
+	print('                                           processes the jobs sent by 12_ConvertTreesToFiguresClient.py.')
+	print('     --socket              <socketFile>    The socket of the daemon, default is $CONVERT_TREES_SOCKET or')
+	print('                                           a socket of the user in the temporary directory.')
 	print('')
 
 ###############################################################################
 
 def parseArgs(progName, argv):
-	# ToDo turn these bunch of values into an opject
-	infile              = ""
-	cladeFile           = ""
-	cladeTreeFile       = ""
-	refSeqFile          = ""
-	specialAminoAcidPos = -1
-	iterestingTaxa      = ""
-	customAA            = ""
-	additionalTaxa      = ""
-	makeLogos           = False
-	refSeqConfigData    = None
+	options = Options()
 
 	try:
-		opts, args = getopt.getopt(argv,"hmt:i:c:f:z:a:x:",["help", "makeLogos", "infile=", "cladefile=", "trees=", "refSeqConfigFile=", "iterestingTaxa", "customAA", "additionalTaxa"])
+		opts, args = getopt.getopt(argv,"hmbpt:i:c:f:z:a:x:j:r:",["help", "makeLogos", "batch", "parallelRender", "infile=", "cladefile=", "trees=", "refSeqConfigFile=", "iterestingTaxa", "customAA", "additionalTaxa", "jobs=", "report=", "headless", "serve", "socket=", "profile"])
 	except getopt.GetoptError as err:
 		print(err, "\n")
 		usage(progName)
@@ -1319,51 +1830,134 @@ def parseArgs(progName, argv):
 			usage(progName)
 			sys.exit()
 		elif opt in ("-m", "--makeLogos"):
-			makeLogos = True
+			options.makeLogos = True
+		elif opt in ("-b", "--batch"):
+			options.batch = True
 		elif opt in ("-i", "--infile"):
-			infile = arg
+			options.infile = arg
+			options.infiles.append(arg)
 		elif opt in ("-c", "--cladefile"):
-			cladeFile = arg
+			options.cladeFile = arg
 		elif opt in ("-t", "--trees"):
-			cladeTreeFile = arg
+			options.cladeTreeFile = arg
 		elif opt in ("-f", "--refSeqConfigFile"):
 			if os.path.isfile(arg):
-				refSeqConfigData = ConfigData(arg)
+				options.refSeqConfigData = ConfigData(arg)
 		elif opt in ("-z", "--iterestingTaxa"):
-			iterestingTaxa = arg
+			options.iterestingTaxa = arg
 		elif opt in ("-a", "--customAA"):
-			customAA = arg
+			options.customAA = arg
 		elif opt in ("-x", "--additionalTaxa"):
-			additionalTaxa = arg
+			options.additionalTaxa = arg
+		elif opt in ("-j", "--jobs"):
+			options.numJobs = int(arg)
+		elif opt in ("-p", "--parallelRender"):
+			options.parallelRender = True
+		elif opt in ("-r", "--report"):
+			options.reportFile = arg
+		elif opt == "--headless":
+			options.headless = True
+		elif opt == "--serve":
+			options.serve = True
+		elif opt == "--socket":
+			options.socketFile = arg
+		elif opt == "--profile":
+			options.profile = True
+
+	return options
+
+###############################################################################
+def setupHeadlessRendering(headless):
+	# Qt reads the platform when ete3 creates its application for the first
+	# rendering, so it is enough to set it before that. On cluster nodes there
+	# is no display, without the offscreen platform Qt would abort.
+	hasDisplay = os.environ.get("DISPLAY", "") != "" or os.environ.get("WAYLAND_DISPLAY", "") != ""
+	if headless or (not hasDisplay and os.environ.get("QT_QPA_PLATFORM", "") == ""):
+		os.environ["QT_QPA_PLATFORM"] = "offscreen"
+
+###############################################################################
+def getNumAllocatedCPUs():
+	# PBS Pro and Slurm tell us how many CPUs the job got
+	for variable in ["NCPUS", "SLURM_CPUS_PER_TASK", "SLURM_CPUS_ON_NODE"]:
+		if variable in os.environ:
+			try:
+				return max(1, int(os.environ[variable]))
+			except ValueError:
+				pass
+
+	return len(os.sched_getaffinity(0))
 
-	return infile, cladeFile, cladeTreeFile, refSeqConfigData, iterestingTaxa, customAA, additionalTaxa, makeLogos
+###############################################################################
+def getGeneraOfLeaves(tree):
+	# Every part of a leaf name may be a genus name, see addHigherTaxaOfInterest
+	genera = set()
+	for leaf in tree.iter_leaves():
+		genera.update(leaf.name.split("_"))
+
+	return genera
+
+###############################################################################
+def readGenusLinagesFromFile(genusDatabase):
+	with open(genusDatabase, 'rt') as genusFile:
+		for line in genusFile:
+			splitLine = line.split("\t")
+			yield splitLine[1], splitLine[2]
+
+###############################################################################
+def readGenusLinagesFromIndex(genusDatabaseIndex, genera):
+	connection = sqlite3.connect(genusDatabaseIndex)
+
+	if genera is None:
+		yield from connection.execute("SELECT genus, linage FROM genusLinage ORDER BY rowid")
+	else:
+		# Stay below the maximum number of host parameters of SQLite
+		genera = sorted(genera)
+		chunkSize = 500
+		for i in range(0, len(genera), chunkSize):
+			chunk = genera[i:i + chunkSize]
+			query = "SELECT genus, linage FROM genusLinage WHERE genus IN (" + ",".join("?" * len(chunk)) + ") ORDER BY rowid"
+			yield from connection.execute(query, chunk)
+
+	connection.close()
 
 ###############################################################################
-def loadTaxa(iterestingTaxa, additionalTaxa):
+def hasUpToDateIndex(genusDatabase, genusDatabaseIndex):
+	if not os.path.isfile(genusDatabaseIndex):
+		return False
+
+	if not os.path.isfile(genusDatabase):
+		return True
+
+	return os.path.getmtime(genusDatabaseIndex) >= os.path.getmtime(genusDatabase)
+
+###############################################################################
+def loadTaxa(iterestingTaxa, additionalTaxa, genera=None):
 	if iterestingTaxa == "":
 		return
 
 	loadColorMap(iterestingTaxa, taxonColorMap)
 
-	genusDatabase = "SpeciesDatabase/GenusLinage.csv"
-	f = open(genusDatabase, 'rt')
-
-	while True:
-		line = f.readline()
-		if not line:
-			break
+	# The index is built by 12b_InstallSpeciesDatabase.sh, with it we only
+	# look up the genera in the tree, genera set to None loads all of them
+	if hasUpToDateIndex(genusDatabase, genusDatabaseIndex):
+		genusLinages = readGenusLinagesFromIndex(genusDatabaseIndex, genera)
+	else:
+		genusLinages = readGenusLinagesFromFile(genusDatabase)
 
-		splitLine = line.split("\t")
+	# Match all taxa at once, instead of searching for each taxon separately
+	regularTaxa   = [taxon for taxon in taxonColorMap if taxonColorMap[taxon].entryType == type_regular]
+	linageMatcher = MultiPatternMatcher([" " + taxon + ";" for taxon in regularTaxa], regularTaxa)
 
-		for taxon in taxonColorMap:
-			if taxonColorMap[taxon].entryType == type_regular:
-				checkString = " " + taxon + ";"
-				if checkString in splitLine[2]:
-					genusInterestingTaxaMap[splitLine[1]] = taxon
+	for genus, linage in genusLinages:
+		taxon = linageMatcher.findLast(linage)
+		if taxon is not None:
+			genusInterestingTaxaMap[genus] = taxon
 
 	if additionalTaxa == "":
 		return
 
+	taxonMatcher = MultiPatternMatcher(regularTaxa, regularTaxa)
+
 	f = open(additionalTaxa, 'rt')
 
 	while True:
@@ -1375,10 +1969,21 @@ def loadTaxa(iterestingTaxa, additionalTaxa):
 
 		splitLine = line.split("\t")
 
-		for taxon in taxonColorMap:
-			if taxonColorMap[taxon].entryType == type_regular:
-				if taxon in splitLine[1]:
-					genusInterestingTaxaMap[splitLine[0]] = taxon
+		taxon = taxonMatcher.findLast(splitLine[1])
+		if taxon is not None:
+			genusInterestingTaxaMap[splitLine[0]] = taxon
+
+###############################################################################
+def loadSharedTaxa(iterestingTaxa, additionalTaxa, genera=None):
+	# The taxa of all genera are kept for the next job as long as none of the files changed
+	key = getFilesKey([iterestingTaxa, additionalTaxa, genusDatabase, genusDatabaseIndex])
+	if sharedDataKeys.get("taxa") == key:
+		return
+
+	taxonColorMap.clear()
+	genusInterestingTaxaMap.clear()
+	loadTaxa(iterestingTaxa, additionalTaxa, genera)
+	sharedDataKeys["taxa"] = key if genera == None else None
 
 ###############################################################################
 def addHigherTaxaOfInterest(tree):
@@ -1395,21 +2000,287 @@ def addHigherTaxaOfInterest(tree):
 				break
 
 ###############################################################################
+def getTreeCacheFile(inputTree):
+	return inputTree + ".tree.npz"
 
-if __name__ == "__main__":
-	# Execute only if run as main script
+###############################################################################
+def getFileHash(fileName):
+	fileHash = hashlib.sha256()
+	with open(fileName, "rb") as inFile:
+		for block in iter(lambda: inFile.read(1 << 20), b""):
+			fileHash.update(block)
 
-	inputTree, inputClades, cladeTreeFile, refSeqConfigData, iterestingTaxa, customAA, additionalTaxa, makeLogos = parseArgs(sys.argv[0], sys.argv[1:])
+	return fileHash.hexdigest()
 
-	alignmentData = AlignmentData(cladeTreeFile)
-	if refSeqConfigData:
-		refSeqConfigData.setAlignmentData(alignmentData)
+###############################################################################
+def getFilesKey(fileNames):
+	# The state of the given files, it changes if one of them changes
+	key = []
+	for fileName in fileNames:
+		if fileName != "" and os.path.isfile(fileName):
+			stat = os.stat(fileName)
+			key.append((os.path.abspath(fileName), stat.st_mtime_ns, stat.st_size))
+		else:
+			key.append((os.path.abspath(fileName) if fileName != "" else "", None, None))
+
+	return tuple(key)
+
+###############################################################################
+def loadTreeFromCache(inputTree):
+	# The cache is valid if the tree file has the same modification time and size
+	# or, if it was only touched or copied, the same content as when it was written
+	treeCacheFile = getTreeCacheFile(inputTree)
+	if not os.path.isfile(treeCacheFile):
+		return None
+
+	try:
+		with np.load(treeCacheFile) as treeCache:
+			treeStat = os.stat(inputTree)
+			isTouched = treeStat.st_mtime_ns != int(treeCache["mtime"]) or treeStat.st_size != int(treeCache["size"])
+			if isTouched and getFileHash(inputTree) != str(treeCache["hash"]):
+				return None
+
+			parents  = treeCache["parents"]
+			dists    = treeCache["dists"]
+			names    = str(treeCache["names"])
+			fileHash = str(treeCache["hash"])
+	except (OSError, ValueError, KeyError) as err:
+		print("Cannot read " + treeCacheFile + ", parsing the tree again:", err, file=sys.stderr)
+		return None
+
+	# Store the new modification time and size, so that the next run needs no hash
+	if isTouched:
+		try:
+			writeTreeCache(inputTree, treeStat, parents, dists, names, fileHash)
+		except OSError as err:
+			print("Cannot update " + treeCacheFile + ":", err, file=sys.stderr)
+
+	parents = parents.tolist()
+	dists   = dists.tolist()
+	names   = names.split("\n")
+
+	# The nodes are stored in preorder, so each parent is made before its children
+	nodes = [Tree(name=names[0], dist=dists[0])]
+	for i in range(1, len(parents)):
+		nodes.append(nodes[parents[i]].add_child(name=names[i], dist=dists[i]))
+
+	return nodes[0]
+
+###############################################################################
+def saveTreeToCache(tree, inputTree):
+	# Store the topology as the parent of each node in preorder
+	nodes = list(tree.traverse("preorder"))
+	nodeIndices = {node: i for i, node in enumerate(nodes)}
+	parents = np.array([nodeIndices[node.up] if node.up != None else -1 for node in nodes], dtype=np.int64)
+	dists   = np.array([node.dist for node in nodes], dtype=np.float64)
+	names   = "\n".join([node.name for node in nodes])
+
+	writeTreeCache(inputTree, os.stat(inputTree), parents, dists, names, getFileHash(inputTree))
+
+###############################################################################
+def writeTreeCache(inputTree, treeStat, parents, dists, names, fileHash):
+	# Write to a temporary file first, since parallel processes might read the cache
+	treeCacheFile = getTreeCacheFile(inputTree)
+	tmpFile = treeCacheFile + "." + str(os.getpid()) + ".tmp"
+	with open(tmpFile, "wb") as treeCacheOut:
+		np.savez(treeCacheOut, parents=parents, dists=dists, names=np.array(names), mtime=np.array(treeStat.st_mtime_ns), size=np.array(treeStat.st_size), hash=np.array(fileHash))
+
+	os.replace(tmpFile, treeCacheFile)
+
+###############################################################################
+def loadTree(inputTree):
+	tree = loadTreeFromCache(inputTree)
+	if tree != None:
+		return tree
+
+	# Format 1 reads names and branch lengths like format 3, but also accepts
+	# nodes without them, so the tree is parsed only once instead of trying
+	# format 3 first and parsing again with format 1 if that fails
+	tree = Tree(inputTree, format=1)
+
+	logging.debug("Remove single quotation marks: " + inputTree)
+	for node in tree.traverse():
+		node.name = node.name.replace('\'', '')
+
+	saveTreeToCache(tree, inputTree)
+
+	return tree
+
+###############################################################################
+def loadAminoAcidColorMaps(customAA):
+	global aminoAcidTreeColorMap
+
+	# Start from empty maps, the daemon loads them for every job
+	colorMapFileName = "AminoAcidColorMap.csv"
+	aminoAcidColorMap.clear()
+	loadColorMap(colorMapFileName, aminoAcidColorMap)
+	if customAA != "":
+		print(customAA)
+		aminoAcidTreeColorMap = {}
+		loadColorMap(customAA, aminoAcidTreeColorMap)
+	else:
+		aminoAcidTreeColorMap = aminoAcidColorMap
+
+###############################################################################
+# The figure variants of a tree in the order they are rendered
+treeVariants = ["fullTree", "tree", "collapsedTree", "collapsedTreeCom", "collapsedTreeSimple", "collapsedTreeSimpleNoSupp", "collapsedTreeLegend"]
+
+###############################################################################
+def prepareTreeVariant(tree, clades, variant):
+	# The style changes build on each other, so a variant needs the
+	# changes of all variants before it
+	if variant == "tree":
+		collapseOnlyOutgroup(tree, clades)
+	elif variant == "collapsedTree":
+		collapseTree(tree, clades)
+	elif variant == "collapsedTreeLegend":
+		tree.img_style["vt_line_color"] = "White"
+		tree.img_style["hz_line_color"] = "White"
+		tree.img_style["vt_line_width"] = 0
+		tree.img_style["hz_line_width"] = 0
+		tree.img_style["fgcolor"] = "White"
+		tree.img_style["size"] =  0
+		tree.faces_bgcolor = "White"
+		tree.img_style["draw_descendants"] = False
+
+###############################################################################
+def renderTreeVariant(tree, variant, outFullTree, outTree, outCollapsedTree):
+	# The layout functions only add temporary faces, which are cleared after
+	# each rendering, so all variants are rendered from the same tree.
+	if variant == "fullTree":
+		logging.debug("Save full tree: " + outFullTree)
+		ts = getFullTreeStyle()
+		tree.render(outFullTree + ".pdf", dpi=600, w=183, units="mm", tree_style=ts)
+		# svg files are not printed correctly, they have duplicated text
+#		tree.render(outFullTree + ".svg", dpi=600, w=183, units="mm", tree_style=ts)
+
+		# Dendroscope cannot load this type of tree
+		#nexml_project = nexml.Nexml()
+		#tree_collection = nexml.Trees()
+		#tree_collection.add_tree(tree)
+		#nexml_project.add_trees(tree_collection)
+
+		#with open(outFullTreeNeXML, "w") as outFile:
+		#	nexml_project.export(outFile)
+		# Even with removing this extra junk Dendroscope cannot load the tree
+		# This may still be code to fix
+		#command = "sed -i -e \"s/b'//g\"  -e \"s/\\\"'/\\\"/g\" " + outFullTreeNeXML
+		#os.system(command)
+
+	elif variant == "tree":
+		logging.debug("Save full tree without outgroup: " + outTree)
+		ts = getFullTreeStyle()
+		tree.render(outTree + ".pdf", dpi=600, w=183, units="mm", tree_style=ts)
+
+	elif variant == "collapsedTree":
+		logging.debug("Save collapsed tree: " + outCollapsedTree)
+		ts = getCollapsedTreeStyle()
+		tree.render(outCollapsedTree + ".pdf", dpi=600, w=400, units="mm", tree_style=ts)
+
+	elif variant == "collapsedTreeCom":
+		ts = getCollapsedTreeStyle()
+		ts.layout_fn = collapsedCompactTreeLayout
+		tree.render(outCollapsedTree + "Com.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+#		tree.render(outCollapsedTree + "Com.svg", dpi=600, w=400, units="mm", tree_style=ts)
+
+	elif variant == "collapsedTreeSimple":
+		ts = getCollapsedSimpleTreeStyle()
+		tree.render(outCollapsedTree + "Simple.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+
+	elif variant == "collapsedTreeSimpleNoSupp":
+		ts = getCollapsedSimpleTreeStyle()
+		ts.layout_fn = collapsedSimpleNoSupportTreeLayout
+		tree.render(outCollapsedTree + "SimpleNoSupp.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+
+	elif variant == "collapsedTreeLegend":
+		# Draw only the legend
+		ts = getLegendOnlyStyle(tree)
+		tree.render(outCollapsedTree + "Legend.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+
+###############################################################################
+# Global variable for the render workers, they are forked and inherit it
+renderState = None
+
+###############################################################################
+def renderTaskInParallel(task):
+	global taxonPercentsFile
+
+	tree, clades, refSeqConfigData, logoOutFileBase, outFullTree, outTree, outCollapsedTree, taxonPercents = renderState
+
+	# The worker measures its own task and hands the stages back
+	if profiler != None:
+		profiler.reset()
+
+	if task == "logos":
+		startStage("Make sequence logos")
+		logging.debug("Make sequence logos: " + logoOutFileBase)
+		makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase)
+		return None, getWorkerStages()
+
+	# Each worker writes its part of the taxon percents to its own file,
+	# the parts are put together in the order of the variants afterwards
+	partFile = taxonPercents + "." + task + ".part"
+	taxonPercentsFile = open(partFile, "w")
+
+	startStage("Render " + task)
+	variantIndex = treeVariants.index(task)
+	for variant in treeVariants[:variantIndex + 1]:
+		prepareTreeVariant(tree, clades, variant)
+
+	renderTreeVariant(tree, task, outFullTree, outTree, outCollapsedTree)
+
+	taxonPercentsFile.close()
+	return partFile, getWorkerStages()
+
+###############################################################################
+def getWorkerStages():
+	if profiler == None:
+		return []
+
+	profiler.stop()
+	for stage in profiler.stages:
+		# These stages overlap with each other
+		stage["parallel"] = True
+
+	return profiler.stages
+
+###############################################################################
+def renderInParallel(tasks, numJobs):
+	numJobs = min(numJobs, len(tasks))
+	logging.debug("Render " + str(len(tasks)) + " figures with " + str(numJobs) + " jobs")
+
+	# Nothing buffered may be written twice by the forked workers
+	taxonPercentsFile.flush()
+	sys.stdout.flush()
+	sys.stderr.flush()
+
+	# Each task gets a fresh worker, since a worker changes the styles of its
+	# tree and these changes must not show up in the next figure
+	with multiprocessing.get_context("fork").Pool(numJobs, maxtasksperchild=1) as pool:
+		results = pool.map(renderTaskInParallel, tasks, chunksize=1)
+
+	for partFile, stages in results:
+		if profiler != None:
+			profiler.stages.extend(stages)
+
+		if partFile == None:
+			continue
+
+		with open(partFile, "r") as part:
+			taxonPercentsFile.write(part.read())
+		os.remove(partFile)
+
+###############################################################################
+def convertTreeToFigures(tree, inputTree, inputClades, cladeTreeFile, refSeqConfigData, alignmentData, makeLogos, numRenderJobs=0):
+	global taxonPercentsFile
+	global renderState
 
 	cladeBase = os.path.basename(inputClades)
 	cladeBase = os.path.splitext(cladeBase)[0]
 
 	cladeTrees             = inputTree + "." + cladeBase + ".cladeTrees"
 	taxonPercents          = inputTree + "." + cladeBase + ".TaxonPercents.txt"
+	cladeSupport           = inputTree + "." + cladeBase + ".CladeSupport.tsv"
 	outCollapsedTree       = inputTree + "." + cladeBase + ".collapsedTree"
 	outFullTree            = inputTree + "." + cladeBase + ".fullTree"
 	outTree                = inputTree + "." + cladeBase + ".tree"
@@ -1419,132 +2290,424 @@ if __name__ == "__main__":
 
 	taxonPercentsFile = open(taxonPercents, "w")
 
-	print("Load tree:", inputTree, file=sys.stderr)
-
-	formats = [3, 1]
-	for f in formats:
-		try:
-			tree = Tree(inputTree, format=f)
-			break
-		except:
-			continue
-
-	logging.debug("Remove single quotation marks: " + inputTree)
-	for node in tree.traverse():
-		node.name = node.name.replace('\'', '')
-
 	if refSeqConfigData != None:
+		startStage("Determine special amino acids")
 		logging.debug("Load amino acid information: " + inputTree)
-		colorMapFileName = "AminoAcidColorMap.csv"
-		loadColorMap(colorMapFileName, aminoAcidColorMap)
 		determineSpecialAminoAcidsAtPos(tree, refSeqConfigData)
-		if customAA != "":
-			print(customAA)
-			loadColorMap(customAA, aminoAcidTreeColorMap)
-		else:
-			aminoAcidTreeColorMap = aminoAcidColorMap
-
-	logging.debug("Load taxon information: " + inputTree)
-	loadTaxa(iterestingTaxa, additionalTaxa)
 
+	startStage("Load clade information")
 	logging.debug("Load clade information: " + inputTree)
-	clades = loadCladeInfo(tree, inputClades, cladeTreeFile)
+	clades = loadCladeInfo(getLeafMap(tree), inputClades, cladeTreeFile)
+	startStage("Initial reroot")
 	logging.debug("Initial reroot for tree: " + inputTree)
 	initialReroot(tree, clades)
+	startStage("Determine clades")
 	logging.debug("Determine clades for tree: " + inputTree)
 	cladifyNodes(tree, clades)
+	startStage("Find higher taxa")
 	logging.debug("Find higher taxa for sequences: " + inputTree)
 	addHigherTaxaOfInterest(tree)
 
 	# Root the tree at the outgroup
+	startStage("Final reroot")
 	logging.debug("Final reroot " + inputTree)
 	rerootToOutgroup(tree, clades)
 
 	# Reinitialize the clades, since they were changed by rerooting
+	startStage("Determine clades after reroot")
 	logging.debug("Determine clades for tree after reroot: " + inputTree)
 	cladifyNodes(tree, clades)
+	startStage("Get clade roots")
 	logging.debug("Get clade roots: " + inputTree)
 	nameCladeRoots(tree, clades)
-
+	startStage("Count leaves and attributes")
+	logging.debug("Count leaves and attributes of each node: " + inputTree)
+	annotateLeafCounts(tree)
+	startStage("Parse support values")
+	logging.debug("Parse support values: " + inputTree)
+	annotateSupportValues(tree)
+	startStage("Write clade support")
+	logging.debug("Write clade support: " + cladeSupport)
+	writeCladeSupport(tree, clades, cladeSupport)
+
+	startStage("Color the clades")
 	logging.debug("Color the clades: " + inputTree)
 	colorAndNameClades(tree, clades)
 
-	if makeLogos and refSeqConfigData != None:
+	if makeLogos and refSeqConfigData != None and numRenderJobs <= 1:
+		startStage("Make sequence logos")
 		logging.debug("Make sequence logos: " + logoOutFileBase)
 		makeSeqLogo(tree, clades, refSeqConfigData, logoOutFileBase)
 
 	isFullTree = (cladeTreeFile == "")
 	if isFullTree:
+		startStage("Sort master alignment")
 		logging.debug("Sort master alignment: " + cladeTrees)
 		sortMasterAlignment(tree, alignmentData, sortedAlignmentFile)
+		startStage("Save the clades")
 		logging.debug("Save the clades:" + cladeTrees)
 		saveCladesAsTrees(tree, clades, cladeTrees)
 
-	# We must copy the tree here, since the render function adds faces we cannot remove
-	# and would still show up at the second rendering
-	logging.debug("Save full tree: " + outFullTree)
-	fullTree = tree.copy()
-	ts = getFullTreeStyle()
+	if numRenderJobs > 1:
+		tasks = list(treeVariants)
+		if makeLogos and refSeqConfigData != None:
+			# The logos take longest, so they start first
+			tasks.insert(0, "logos")
+
+		startStage("Render in parallel")
+		renderState = (tree, clades, refSeqConfigData, logoOutFileBase, outFullTree, outTree, outCollapsedTree, taxonPercents)
+		renderInParallel(tasks, numRenderJobs)
+		renderState = None
+	else:
+		for variant in treeVariants:
+			startStage("Render " + variant)
+			prepareTreeVariant(tree, clades, variant)
+			renderTreeVariant(tree, variant, outFullTree, outTree, outCollapsedTree)
+
+	# Just be formal, this should happen automatically
+	taxonPercentsFile.close()
+
+	if profiler != None:
+		profiler.save(inputTree + "." + cladeBase + ".profile.json", inputTree)
+
+###############################################################################
+def convertOneTree(inputTree, inputClades, cladeTreeFile, refSeqConfigData, iterestingTaxa, customAA, additionalTaxa, makeLogos, numRenderJobs=0):
+	startStage("Load alignment")
+	alignmentData = getSharedAlignmentData(inputTree, cladeTreeFile)
+	if refSeqConfigData:
+		refSeqConfigData.setAlignmentData(alignmentData)
+		loadAminoAcidColorMaps(customAA)
+
+	startStage("Load tree")
+	print("Load tree:", inputTree, file=sys.stderr)
+	tree = loadTree(inputTree)
 
-	fullTree.render(outFullTree + ".pdf", dpi=600, w=183, units="mm", tree_style=ts)
-	# svg files are not printed correctly, they have duplicated text
-#	fullTree.render(outFullTree + ".svg", dpi=600, w=183, units="mm", tree_style=ts)
+	startStage("Load taxon information")
+	logging.debug("Load taxon information: " + inputTree)
+	loadSharedTaxa(iterestingTaxa, additionalTaxa, getGeneraOfLeaves(tree))
 
-	# Dendroscope cannot load this type of tree
-	#nexml_project = nexml.Nexml()
-	#tree_collection = nexml.Trees()
-	#tree_collection.add_tree(tree)
-	#nexml_project.add_trees(tree_collection)
+	convertTreeToFigures(tree, inputTree, inputClades, cladeTreeFile, refSeqConfigData, alignmentData, makeLogos, numRenderJobs)
 
-	#with open(outFullTreeNeXML, "w") as outFile:
-	#	nexml_project.export(outFile)
-	# Even with removing this extra junk Dendroscope cannot load the tree
-	# This may still be code to fix
-	#command = "sed -i -e \"s/b'//g\"  -e \"s/\\\"'/\\\"/g\" " + outFullTreeNeXML
-	#os.system(command)
+###############################################################################
+# Global variable for the batch workers, they are forked and inherit it
+batchOptions = None
 
-	logging.debug("Save full tree without outgroup: " + outTree)
-	collapseOnlyOutgroup(tree, clades) # This will be done on the original tree anyway
-	collapsedOutgroupTree = tree.copy()
+###############################################################################
+def convertTreeInBatch(inputTree):
+	options = batchOptions
+	try:
+		# The shared data is measured by the batch process
+		if profiler != None:
+			profiler.reset()
+
+		startStage("Load alignment")
+		alignmentData = options.refSeqConfigData.alignmentData if options.refSeqConfigData else None
+		if alignmentData == None:
+			alignmentData = getSharedAlignmentData(inputTree, options.cladeTreeFile)
+			if options.refSeqConfigData:
+				options.refSeqConfigData.setAlignmentData(alignmentData)
+
+		startStage("Load tree")
+		print("Load tree:", inputTree, file=sys.stderr)
+		tree = loadTree(inputTree)
+		convertTreeToFigures(tree, inputTree, options.cladeFile, options.cladeTreeFile, options.refSeqConfigData, alignmentData, options.makeLogos)
+	except Exception as err:
+		traceback.print_exc()
+		return inputTree, False, repr(err)
+
+	return inputTree, True, ""
 
-	collapsedOutgroupTree.render(outTree + ".pdf", dpi=600, w=183, units="mm", tree_style=ts)
+###############################################################################
+def loadSharedData(options):
+	# Load everything the trees share only once, the batch workers and the jobs
+	# of the daemon inherit it. The master alignment is shared if all trees come
+	# from the same master tree. The daemon calls this for every job, but
+	# only loads again what changed since the job before.
+	if options.cladeTreeFile != "" and options.refSeqConfigData or not options.batch:
+		alignmentData = getSharedAlignmentData("" if options.batch else options.infile, options.cladeTreeFile)
+		# Build the id index once, instead of in every worker
+		alignmentData.getRowMap()
+		if options.batch and options.refSeqConfigData.alignmentData != alignmentData:
+			options.refSeqConfigData.setAlignmentData(alignmentData)
+	if options.refSeqConfigData:
+		loadAminoAcidColorMaps(options.customAA)
+
+	if options.cladeTreeFile != "":
+		loadCladeMembers(options.cladeTreeFile)
+
+	logging.debug("Load taxon information for all genera")
+	loadSharedTaxa(options.iterestingTaxa, options.additionalTaxa)
 
-	logging.debug("Save collapsed tree: " + outCollapsedTree)
-	collapseTree(tree, clades) # This will be done on the original tree anyway
+###############################################################################
+def convertTreesInBatch(options):
+	global batchOptions
 
-	collTree = tree.copy()
+	inputTrees = []
+	for pattern in options.infiles:
+		matches = sorted(glob.glob(pattern))
+		if len(matches) == 0:
+			# Keep it, so that it is reported as failed
+			matches = [pattern]
+		inputTrees.extend(matches)
 
-	ts = getCollapsedTreeStyle()
-	collTree.render(outCollapsedTree + ".pdf", dpi=600, w=400, units="mm", tree_style=ts)
+	startStage("Load shared data")
+	loadSharedData(options)
+	if profiler != None:
+		profiler.stop()
 
-	comTree = tree.copy()
+	batchOptions = options
 
-	ts.layout_fn = collapsedCompactTreeLayout
+	numJobs = options.numJobs if options.numJobs > 0 else getNumAllocatedCPUs()
+	numJobs = min(numJobs, max(1, len(inputTrees)))
+	print("Process", len(inputTrees), "trees with", numJobs, "jobs", file=sys.stderr)
 
-	comTree.render(outCollapsedTree + "Com.pdf", dpi=600, w=400, units="mm", tree_style=ts)
-#	comTree.render(outCollapsedTree + "Com.svg", dpi=600, w=400, units="mm", tree_style=ts)
+	# Each tree gets a fresh worker, since processing a tree changes global state
+	results = []
+	with multiprocessing.get_context("fork").Pool(numJobs, maxtasksperchild=1) as pool:
+		for inputTree, success, message in pool.imap_unordered(convertTreeInBatch, inputTrees):
+			print(("OK:     " if success else "FAILED: ") + inputTree + (" " + message if message else ""), file=sys.stderr)
+			results.append((inputTree, success, message))
 
-	simpleTree = tree.copy()
-	ts = getCollapsedSimpleTreeStyle()
-	simpleTree.render(outCollapsedTree + "Simple.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+	numFailed = len([result for result in results if not result[1]])
+	print("Processed", len(results), "trees,", numFailed, "failed", file=sys.stderr)
 
-	noSupportTree = tree.copy()
-	ts.layout_fn = collapsedSimpleNoSupportTreeLayout
-	noSupportTree.render(outCollapsedTree + "SimpleNoSupp.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+	if options.reportFile != "":
+		with open(options.reportFile, "w") as reportFile:
+			for inputTree, success, message in results:
+				reportFile.write(inputTree + "\t" + ("OK" if success else "FAILED") + "\t" + message + "\n")
 
-	# Draw only the legend
-	ts = getLegendOnlyStyle(tree)
-	tree.img_style["vt_line_color"] = "White"
-	tree.img_style["hz_line_color"] = "White"
-	tree.img_style["vt_line_width"] = 0
-	tree.img_style["hz_line_width"] = 0
-	tree.img_style["fgcolor"] = "White"
-	tree.img_style["size"] =  0
-	tree.faces_bgcolor = "White"
-	tree.img_style["draw_descendants"] = False
-	tree.render(outCollapsedTree + "Legend.pdf", dpi=600, w=400, units="mm", tree_style=ts)
+		if profiler != None:
+			profiler.save(options.reportFile + ".profile.json", "")
 
-	# Just be formal, this should happen automatically
-	taxonPercentsFile.close()
+	return numFailed == 0
+
+###############################################################################
+def runJob(options):
+	global profiler
+
+	setupHeadlessRendering(options.headless)
+	profiler = StageProfiler() if options.profile else None
+
+	if options.batch:
+		return convertTreesInBatch(options)
+
+	numRenderJobs = 0
+	if options.parallelRender:
+		numRenderJobs = options.numJobs if options.numJobs > 0 else getNumAllocatedCPUs()
+
+	convertOneTree(options.infile, options.cladeFile, options.cladeTreeFile, options.refSeqConfigData, options.iterestingTaxa, options.customAA, options.additionalTaxa, options.makeLogos, numRenderJobs)
+	return True
+
+###############################################################################
+def getSocketFile(socketFile):
+	# 12_ConvertTreesToFiguresClient.py finds the daemon the same way
+	if socketFile != "":
+		return os.path.abspath(socketFile)
+	if os.environ.get("CONVERT_TREES_SOCKET", "") != "":
+		return os.path.abspath(os.environ["CONVERT_TREES_SOCKET"])
+
+	return os.path.join(tempfile.gettempdir(), "12_ConvertTreesToFigures." + str(os.getuid()) + ".socket")
+
+###############################################################################
+def readRequest(connection):
+	# A job is sent as one line of JSON with the arguments and the working directory
+	request = b""
+	while not request.endswith(b"\n"):
+		data = connection.recv(65536)
+		if not data:
+			break
+		request += data
+
+	return request
+
+###############################################################################
+def sendChunk(connection, channel, data):
+	# Everything sent to the client is a chunk: the channel, 1 for stdout,
+	# 2 for stderr and 0 for the exit code, and the length of the data
+	connection.sendall(channel.to_bytes(1, "big") + len(data).to_bytes(4, "big") + data)
+
+###############################################################################
+def forwardJobOutput(connection, outPipe, errPipe):
+	# Sends what the job writes to the client until the job closes both pipes
+	channels = {outPipe: 1, errPipe: 2}
+	while len(channels) > 0:
+		readable, writable, failed = select.select(list(channels), [], [])
+		for pipe in readable:
+			data = os.read(pipe, 65536)
+			if data:
+				sendChunk(connection, channels[pipe], data)
+			else:
+				os.close(pipe)
+				del channels[pipe]
+
+###############################################################################
+def runJobInChild(request, options):
+	# Runs in the child of the job with stdout and stderr in the pipes,
+	# returns the exit code. The request is parsed again, so that the
+	# client sees why it could not be read.
+	exitCode = 1
+	try:
+		job = json.loads(request.decode("utf-8"))
+		os.chdir(job["cwd"])
+
+		if options == None:
+			options = parseArgs(sys.argv[0], job["argv"])
+
+		if options.serve:
+			print("A daemon cannot be started by a job of another daemon.", file=sys.stderr)
+			exitCode = 2
+		else:
+			exitCode = 0 if runJob(options) else 1
+	except SystemExit as err:
+		exitCode = err.code if isinstance(err.code, int) else (0 if err.code == None else 1)
+	except BaseException:
+		traceback.print_exc()
+	finally:
+		try:
+			sys.stdout.flush()
+			sys.stderr.flush()
+		except BaseException:
+			pass
+
+	return exitCode
+
+###############################################################################
+def runJobForClient(connection, request, options):
+	# Runs in the forked child. The job runs in a child of its own, which
+	# writes its stdout and stderr to pipes, so that they reach the client
+	# apart. At the end the client gets the exit code, also if the job failed.
+	exitCode = 1
+	try:
+		signal.signal(signal.SIGTERM, signal.SIG_DFL)
+		outRead, outWrite = os.pipe()
+		errRead, errWrite = os.pipe()
+
+		jobPid = os.fork()
+		if jobPid == 0:
+			connection.close()
+			os.close(outRead)
+			os.close(errRead)
+			os.dup2(outWrite, 1)
+			os.dup2(errWrite, 2)
+			os.close(outWrite)
+			os.close(errWrite)
+			os._exit(runJobInChild(request, options))
+
+		os.close(outWrite)
+		os.close(errWrite)
+		forwardJobOutput(connection, outRead, errRead)
+
+		# Killed by a signal, reported like the shell does
+		exitCode = os.waitstatus_to_exitcode(os.waitpid(jobPid, 0)[1])
+		if exitCode < 0:
+			exitCode = 128 - exitCode
+	except BaseException:
+		traceback.print_exc()
+	finally:
+		try:
+			sendChunk(connection, 0, str(exitCode).encode())
+		finally:
+			os._exit(0)
+
+###############################################################################
+def serveJob(server, connection):
+	# Load the shared data in the daemon, so that the next jobs find it, and
+	# go back to the directory of the daemon. If this fails, the job starts
+	# from scratch and reports the error, the job always gets a child.
+	request   = b""
+	options   = None
+	daemonDir = os.getcwd()
+	try:
+		request = readRequest(connection)
+		job     = json.loads(request.decode("utf-8"))
+		os.chdir(job["cwd"])
+
+		with open(os.devnull, "w") as devnull:
+			sys.stdout = devnull
+			try:
+				options = parseArgs(sys.argv[0], job["argv"])
+			finally:
+				sys.stdout = sys.__stdout__
+		if not options.serve:
+			loadSharedData(options)
+	except (Exception, SystemExit):
+		options = None
+	finally:
+		os.chdir(daemonDir)
+
+	sys.stdout.flush()
+	sys.stderr.flush()
+
+	if os.fork() == 0:
+		server.close()
+		runJobForClient(connection, request, options)
+
+###############################################################################
+def serveJobs(socketFile):
+	# The daemon never renders itself, every job is processed by a forked child.
+	# So a job cannot change the state of the daemon, and Qt is only started
+	# in the children, which would not survive a fork otherwise.
+	importLogoModules()
+
+	if os.path.exists(socketFile):
+		probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		try:
+			probe.connect(socketFile)
+			probe.close()
+			print("A daemon is already running on", socketFile, file=sys.stderr)
+			sys.exit(1)
+		except ConnectionRefusedError:
+			# Left over from a daemon that was killed
+			os.remove(socketFile)
+
+	server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	# Only the user may send jobs
+	oldUmask = os.umask(0o177)
+	try:
+		server.bind(socketFile + "." + str(os.getpid()))
+	finally:
+		os.umask(oldUmask)
+	server.listen(16)
+
+	# The socket gets its name once it listens, so that
+	# a client never finds a socket that refuses it
+	os.rename(socketFile + "." + str(os.getpid()), socketFile)
+
+	# Leave through the finally block below, so that the socket is removed
+	signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+	print("Wait for jobs on", socketFile, file=sys.stderr)
+
+	try:
+		while True:
+			connection, address = server.accept()
+			with connection:
+				try:
+					serveJob(server, connection)
+				except Exception:
+					traceback.print_exc()
+
+			# Reap the finished jobs
+			try:
+				while os.waitpid(-1, os.WNOHANG)[0] != 0:
+					pass
+			except ChildProcessError:
+				pass
+	except KeyboardInterrupt:
+		pass
+	finally:
+		server.close()
+		os.remove(socketFile)
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	options = parseArgs(sys.argv[0], sys.argv[1:])
+
+	if options.serve:
+		serveJobs(getSocketFile(options.socketFile))
+	elif not runJob(options):
+		sys.exit(1)
 
 ###############################################################################
@@ -31,6 +31,9 @@
 #     Fail gracefully if the master tree file does not exist, yet.
 #     Useful in automatic processing when it is expected that
 #     this file may not exist yet
+#  --profile (-P)
+#     Write the time and memory of each stage next to the figures,
+#     summarize them with 12c_SummarizeProfiles.py
 #
 
 # Creates a png copy from a pdf file
@@ -143,6 +146,11 @@ do
         -M)
             ignoreIfMasterFileDoesNotExist="True"
             ;;
+        --profile)
+            ;&
+        -P)
+            profile="--profile"
+            ;;
         -*)
             ;&
         --*)
@@ -271,36 +279,111 @@ fi
 
 echo "Using $cladeFile" >&2
 
-# Process the master tree file if it does not exist or should be updated.
-if [[ ! -f "$cladeTreeFile" || ! -z "$updateBig" ]]
+# Each tree gets a manifest with the hashes of its input files, so that
+# a tree is only processed again if one of its inputs changed
+sharedInputs=("$cladeFile" "$seqConfigFile" "$interestingTaxa" "$DIR/AminoAcidColorMap.csv" "$aaFile" "$additionalTaxa")
+
+# Prints the hashes of the given files, missing files are listed as such
+getInputHashes()
+{
+	for inputFile in "$@"
+	do
+		if [[ -f "$inputFile" ]]
+		then
+			sha256sum "$inputFile"
+		else
+			echo "missing  $inputFile"
+		fi
+	done
+}
+
+# Succeeds if the output file is missing, the input hashes differ from the
+# manifest, or a run was started and did not finish. Each run leaves a
+# pending marker next to the manifest, which is removed only when the run
+# succeeded. Outputs made before there were manifests have neither, they
+# are taken as up to date and get a manifest with the current hashes.
+isOutdated()
+{
+	local outputFile="$1"
+	local manifestFile="$2"
+	local inputHashes="$3"
+
+	if [[ ! -f "$outputFile" || -f "$manifestFile.pending" ]]
+	then
+		return 0
+	fi
+
+	if [[ ! -f "$manifestFile" ]]
+	then
+		echo "$inputHashes" > "$manifestFile"
+		return 1
+	fi
+
+	[[ "$(cat "$manifestFile")" != "$inputHashes" ]]
+}
+
+masterTree="$inputTree"
+manifestFile="$inputTree.$cladeBase.manifest"
+inputHashes=$(getInputHashes "$inputTree" "${sharedInputs[@]}")
+
+# Process the master tree file if it does not exist, its inputs changed, or it should be updated.
+if [[ ! -z "$updateBig" ]] || isOutdated "$cladeTreeFile" "$manifestFile" "$inputHashes"
 then
 	echo "Processing $inputTree" >&2
 	echo "Creating $cladeTreeFile" >&2
-	python3 "$DIR/12_ConvertTreesToFigures.py" -m -i "$inputTree" -c "$cladeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa"
+	touch "$manifestFile.pending"
+	if python3 "$DIR/12_ConvertTreesToFiguresClient.py" $profile -m -p -i "$inputTree" -c "$cladeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa"
+	then
+		echo "$inputHashes" > "$manifestFile"
+		rm -f "$manifestFile.pending"
+	fi
 
 	# Make a png version of the full tree
 	pdf2png "$inputTreeDir/$inputTreeBase.$extension.$cladeBase.fullTree"
 fi
 
+# The other trees also depend on the clade trees of the master tree
+sharedInputs+=("$cladeTreeFile")
+sharedHashes=$(getInputHashes "${sharedInputs[@]}")
+
 # Get the names of the input files, second for the nth iteration master tree
 inputTree="$AlignmentDir/SequencesOfInterest$alignmentExtension.$extension"
 inputTreeBase=$(basename "$inputTree" ".$extension")
 inputTreeDir=$(dirname "$inputTree")
 outputFile="$inputTreeDir/$inputTreeBase.$extension.$cladeBase.collapsedTree.pdf"
+manifestFile="$inputTree.$cladeBase.manifest"
+inputHashes="$(getInputHashes "$inputTree")"$'\n'"$sharedHashes"
 
 echo "Using $cladeTreeFile" >&2
 
-# Process the nth iteration master tree file if it does not exist or should be updated.
+# Process the nth iteration master tree file if it does not exist, should be updated,
+# or its inputs changed, the latter only if it is not the master tree itself.
+processTree=""
 if [[ -f "$inputTree" && ! -f "$outputFile" || -f "$inputTree" && ! -z "$update" && "$iteration" != "$baseIteration" ]]
+then
+	processTree="True"
+elif [[ -f "$inputTree" && "$inputTree" != "$masterTree" ]] && isOutdated "$outputFile" "$manifestFile" "$inputHashes"
+then
+	processTree="True"
+fi
+
+if [[ ! -z "$processTree" ]]
 then
 	echo "Processing $inputTree" >&2
-	python3 "$DIR/12_ConvertTreesToFigures.py" -i "$inputTree" -c "$cladeFile" -t "$cladeTreeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa"
+	touch "$manifestFile.pending"
+	if python3 "$DIR/12_ConvertTreesToFiguresClient.py" $profile -i "$inputTree" -c "$cladeFile" -t "$cladeTreeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa"
+	then
+		echo "$inputHashes" > "$manifestFile"
+		rm -f "$manifestFile.pending"
+	fi
 
 	# Make a png version of the full tree
 	pdf2png "$inputTreeDir/$inputTreeBase.$extension.$cladeBase.fullTree"
 fi
 
 # Get the names of the input files, third for the nth iteration sub trees
+partTreeArgs=()
+declare -A partTreeHashes
 for inputTree in "$AlignmentParts"*".$extension"
 do
 	if [ ! -f "$inputTree" ]
@@ -311,13 +394,36 @@ do
 	inputTreeBase=$(basename "$inputTree" ".$extension")
 	inputTreeDir=$(dirname "$inputTree")
 	outputFile="$inputTreeDir/$inputTreeBase.$extension.$cladeBase.collapsedTree.pdf"
+	manifestFile="$inputTree.$cladeBase.manifest"
+	inputHashes="$(getInputHashes "$inputTree")"$'\n'"$sharedHashes"
 
-	if [[ ! -f "$outputFile" || ! -z "$update" ]]
+	if [[ ! -z "$update" ]] || isOutdated "$outputFile" "$manifestFile" "$inputHashes"
 	then
 		echo "Processing $inputTree" >&2
-		python3 "$DIR/12_ConvertTreesToFigures.py" -i "$inputTree" -c "$cladeFile" -t "$cladeTreeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa" &
+		touch "$manifestFile.pending"
+		partTreeArgs+=("-i" "$inputTree")
+		partTreeHashes["$inputTree"]="$inputHashes"
 	fi
 done
 
-wait # Wait on all the instances of 12_ConvertTreesToFigures.py to finish
+# Process all sub trees in one batch, the shared input files are loaded once
+# and the number of trees processed at the same time is limited by the number
+# of CPUs allocated by the scheduler, the -i options must come before the
+# optional arguments, since these can be empty
+if (( ${#partTreeArgs[@]} > 0 ))
+then
+	reportFile="$AlignmentParts$cladeBase.report.tsv"
+	rm -f "$reportFile"
+	python3 "$DIR/12_ConvertTreesToFiguresClient.py" $profile --batch "${partTreeArgs[@]}" -r "$reportFile" -c "$cladeFile" -t "$cladeTreeFile" -f "$seqConfigFile" "$interestingTaxaArg" "$interestingTaxa" "$aaFileArg" "$aaFile" "$additionalTaxaArg" "$additionalTaxa"
+
+	# Only the trees that were processed successfully get a new manifest
+	while IFS=$'\t' read -r inputTree status message
+	do
+		if [[ "$status" == "OK" ]]
+		then
+			echo "${partTreeHashes["$inputTree"]}" > "$inputTree.$cladeBase.manifest"
+			rm -f "$inputTree.$cladeBase.manifest.pending"
+		fi
+	done < <(test -f "$reportFile" && cat "$reportFile")
+fi
 
@@ -0,0 +1,82 @@
+#!/bin/python3
+
+# Sends a job to the daemon of 12_ConvertTreesToFigures.py, started with --serve,
+# and prints what the job prints to stdout and stderr. The arguments are the same
+# as for 12_ConvertTreesToFigures.py. If no daemon is running, the job runs here,
+# unless $CONVERT_TREES_REQUIRE_DAEMON is set.
+# Only modules that load fast are imported, the client is started for each tree.
+
+import json
+import os
+import socket
+import sys
+import tempfile
+
+###############################################################################
+def getSocketFile():
+	# The same as getSocketFile in 12_ConvertTreesToFigures.py
+	if os.environ.get("CONVERT_TREES_SOCKET", "") != "":
+		return os.path.abspath(os.environ["CONVERT_TREES_SOCKET"])
+
+	return os.path.join(tempfile.gettempdir(), "12_ConvertTreesToFigures." + str(os.getuid()) + ".socket")
+
+###############################################################################
+def runLocally(argv):
+	script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "12_ConvertTreesToFigures.py")
+	os.execv(sys.executable, [sys.executable, script] + argv)
+
+###############################################################################
+def receive(client, size):
+	# Less than size bytes only if the daemon closed the connection
+	data = b""
+	while len(data) < size:
+		chunk = client.recv(size - len(data))
+		if not chunk:
+			break
+		data += chunk
+
+	return data
+
+###############################################################################
+def runOnDaemon(client, argv):
+	request = {"argv": argv, "cwd": os.getcwd()}
+	client.sendall((json.dumps(request) + "\n").encode("utf-8"))
+
+	# The output of the job in chunks, see sendChunk in 12_ConvertTreesToFigures.py,
+	# stdout and stderr apart, the last chunk has the exit code
+	outputs = {1: sys.stdout.buffer, 2: sys.stderr.buffer}
+	while True:
+		header = receive(client, 5)
+		if len(header) < 5:
+			break
+
+		channel = header[0]
+		data = receive(client, int.from_bytes(header[1:], "big"))
+		if channel == 0:
+			return int(data)
+
+		outputs[channel].write(data)
+		outputs[channel].flush()
+
+	print("The daemon stopped before the job finished.", file=sys.stderr)
+	return 1
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+	try:
+		client.connect(getSocketFile())
+	except OSError as err:
+		client.close()
+		if os.environ.get("CONVERT_TREES_REQUIRE_DAEMON", "") != "":
+			print("No daemon on " + getSocketFile() + ":", err, file=sys.stderr)
+			sys.exit(1)
+		runLocally(sys.argv[1:])
+
+	with client:
+		sys.exit(runOnDaemon(client, sys.argv[1:]))
+
+###############################################################################
@@ -31,6 +31,9 @@
 #     Fail gracefully if the master tree file does not exist, yet.
 #     Useful in automatic processing when it is expected that
 #     this file may not exist yet
+#  --profile (-P)
+#     Write the time and memory of each stage next to the figures,
+#     summarize them with 12c_SummarizeProfiles.py
 #
 
 # Get the directory where this script is
@@ -125,6 +128,11 @@ do
         -M)
             ignoreIfMasterFileDoesNotExist="--ignoreIfMasterFileDoesNotExist"
             ;;
+        --profile)
+            ;&
+        -P)
+            profile="--profile"
+            ;;
         -*)
             ;&
         --*)
@@ -143,7 +151,21 @@ then
 	exit 1
 fi
 
+# Keep the shared input files loaded for all clade files, the
+# Python calls of 12_ConvertTreesToFigures.sh send their jobs to it
+export CONVERT_TREES_SOCKET="$(mktemp -u "${TMPDIR:-/tmp}/12_ConvertTreesToFigures.XXXXXX.socket")"
+python3 "$DIR/12_ConvertTreesToFigures.py" --serve --socket "$CONVERT_TREES_SOCKET" &
+serverPid=$!
+trap 'kill $serverPid 2> /dev/null' EXIT
+
+# Until the daemon listens, the jobs run without it
+for i in {1..50}
+do
+	[ -S "$CONVERT_TREES_SOCKET" ] && break
+	sleep 0.1
+done
+
 for cladeFile in "$DIR/$gene/"*"Clades.csv"
 do
-	"$DIR/12_ConvertTreesToFigures.sh" -g "$gene" -c "$cladeFile" $iteration $aligner $baseIteration $masterAligner $inputDir $suffix $masterSuffix $extension $update $updateBig $ignoreIfMasterFileDoesNotExist
+	"$DIR/12_ConvertTreesToFigures.sh" -g "$gene" -c "$cladeFile" $iteration $aligner $baseIteration $masterAligner $inputDir $suffix $masterSuffix $extension $update $updateBig $ignoreIfMasterFileDoesNotExist $profile
 done
@@ -0,0 +1,79 @@
+#!/bin/python3
+
+import sqlite3
+import os # Strip extension from file
+import sys, getopt # Parse program arguments
+
+###############################################################################
+def usage(progName):
+	print(progName, "builds an SQLite index from the genus lineage file of the")
+	print("species database, so that lineages can be looked up by genus name.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -i, --infile              <infile>        The genus lineage file, for instance SpeciesDatabase/GenusLinage.csv.')
+	print(' -o, --outfile             <outfile>       The index file to write, for instance SpeciesDatabase/GenusLinage.sqlite.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	infile  = ""
+	outfile = ""
+
+	try:
+		opts, args = getopt.getopt(argv,"hi:o:",["help", "infile=", "outfile="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-i", "--infile"):
+			infile = arg
+		elif opt in ("-o", "--outfile"):
+			outfile = arg
+
+	if infile == "" or outfile == "":
+		usage(progName)
+		sys.exit(2)
+
+	return infile, outfile
+
+###############################################################################
+def indexGenusLinages(genusDatabase, genusDatabaseIndex):
+	# Write to a temporary file first, so that nobody picks up a half written index
+	tmpIndex = genusDatabaseIndex + ".tmp"
+	if os.path.isfile(tmpIndex):
+		os.remove(tmpIndex)
+
+	connection = sqlite3.connect(tmpIndex)
+	connection.execute("CREATE TABLE genusLinage (genus TEXT NOT NULL, linage TEXT NOT NULL)")
+
+	# The file is in the format "taxonID\tgenus\tlinage", the row ID keeps
+	# the order of the file, so that duplicated genus names resolve as before
+	with open(genusDatabase, 'rt') as genusFile:
+		rows = []
+		for line in genusFile:
+			splitLine = line.rstrip("\n").split("\t")
+			if len(splitLine) < 3:
+				continue
+
+			rows.append((splitLine[1], splitLine[2]))
+
+		connection.executemany("INSERT INTO genusLinage (genus, linage) VALUES (?, ?)", rows)
+
+	connection.execute("CREATE INDEX genusIndex ON genusLinage (genus)")
+	connection.commit()
+	connection.close()
+
+	os.replace(tmpIndex, genusDatabaseIndex)
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	genusDatabase, genusDatabaseIndex = parseArgs(sys.argv[0], sys.argv[1:])
+	indexGenusLinages(genusDatabase, genusDatabaseIndex)
+
+###############################################################################
@@ -17,6 +17,7 @@ speciesDatabase="$DIR/SpeciesDatabase"
 genusLinagesRaw="$speciesDatabase/rankedlineage.dmp"
 genusLinagesFull="$speciesDatabase/fullnamelineage.dmp"
 genusLinages="$speciesDatabase/GenusLinage.csv"
+genusLinagesIndex="$speciesDatabase/GenusLinage.sqlite"
 taxonIDs="$speciesDatabase/TaxonIds.txt"
 
 mkdir -p "$speciesDatabase"
@@ -44,3 +45,10 @@ then
 	sed -E "s/	\|//g" | \
 	sed -E "s/ $//g" > "$genusLinages"
 fi
+
+# Index the genus entries, so that 12_ConvertTreesToFigures.py can look up
+# only the genera in the tree instead of scanning the whole lineage file
+if [[ ! -f "$genusLinagesIndex" || "$genusLinages" -nt "$genusLinagesIndex" ]]
+then
+	python3 "$DIR/12b_IndexSpeciesDatabase.py" -i "$genusLinages" -o "$genusLinagesIndex"
+fi
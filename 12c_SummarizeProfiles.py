@@ -0,0 +1,126 @@
+#!/bin/python3
+
+import json
+import os # Strip extension from file
+import sys, getopt # Parse program arguments
+import glob # Expand input patterns
+
+###############################################################################
+def usage(progName):
+	print(progName, "summarizes the profiles written by 12_ConvertTreesToFigures.py with --profile,")
+	print("for instance of all part trees of an iteration, as a tab separated table with a line per stage.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -i, --infile              <infile>        A profile file, a directory with profile files, or a quoted glob pattern,')
+	print('                                           such as "dir/*.profile.json". This option can be given several times.')
+	print(' -o, --outfile             <outfile>       The file to write the summary to, default is the standard output.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	infiles = []
+	outfile = ""
+
+	try:
+		opts, args = getopt.getopt(argv,"hi:o:",["help", "infile=", "outfile="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-i", "--infile"):
+			infiles.append(arg)
+		elif opt in ("-o", "--outfile"):
+			outfile = arg
+
+	if len(infiles) == 0:
+		usage(progName)
+		sys.exit(2)
+
+	return infiles, outfile
+
+###############################################################################
+def getProfileFiles(infiles):
+	profileFiles = []
+	for pattern in infiles:
+		if os.path.isdir(pattern):
+			pattern = os.path.join(pattern, "*.profile.json")
+		profileFiles.extend(sorted(glob.glob(pattern)))
+
+	return profileFiles
+
+###############################################################################
+def summarizeProfiles(profileFiles):
+	# Sums the stages of the same name over all profiles, stages of
+	# the parallel render workers are kept apart, since they overlap
+	summary = {}
+	for profileFile in profileFiles:
+		with open(profileFile, "r") as profileIn:
+			profile = json.load(profileIn)
+
+		for stage in profile["stages"]:
+			name = stage["stage"] + (" (parallel)" if stage.get("parallel", False) else "")
+			if name not in summary:
+				summary[name] = {"count": 0, "wallTime": 0.0, "maxWallTime": 0.0, "cpuTime": 0.0, "childCpuTime": 0.0, "peakRSS": 0.0, "childPeakRSSGrowth": 0.0, "maxWallTimeTree": ""}
+
+			stageSummary = summary[name]
+			stageSummary["count"]        += 1
+			stageSummary["wallTime"]     += stage["wallTime"]
+			stageSummary["cpuTime"]      += stage["cpuTime"]
+			stageSummary["childCpuTime"] += stage["childCpuTime"]
+			stageSummary["peakRSS"]       = max(stageSummary["peakRSS"], stage["peakRSS"])
+			stageSummary["childPeakRSSGrowth"] = max(stageSummary["childPeakRSSGrowth"], stage.get("childPeakRSSGrowth", 0.0))
+			if stage["wallTime"] >= stageSummary["maxWallTime"]:
+				stageSummary["maxWallTime"]     = stage["wallTime"]
+				stageSummary["maxWallTimeTree"] = profile["tree"] if profile["tree"] != "" else profileFile
+
+	return summary
+
+###############################################################################
+def writeSummary(summary, numProfiles, outFile):
+	totalWallTime = sum(stageSummary["wallTime"] for name, stageSummary in summary.items() if not name.endswith(" (parallel)"))
+
+	outFile.write("# " + str(numProfiles) + " profiles, " + f"{totalWallTime:.3f}" + " s wall time\n")
+	outFile.write("Stage\tCount\tWallTime\tWallTimePercent\tMeanWallTime\tMaxWallTime\tCPUTime\tChildCPUTime\tPeakRSS(MB)\tChildPeakRSSGrowth(MB)\tSlowestTree\n")
+
+	# The slowest stages first
+	for name in sorted(summary, key=lambda name: summary[name]["wallTime"], reverse=True):
+		stageSummary = summary[name]
+		percent = 100 * stageSummary["wallTime"] / totalWallTime if totalWallTime > 0 and not name.endswith(" (parallel)") else 0.0
+		outFile.write("\t".join([
+			name,
+			str(stageSummary["count"]),
+			f"{stageSummary['wallTime']:.3f}",
+			f"{percent:.1f}",
+			f"{stageSummary['wallTime'] / stageSummary['count']:.3f}",
+			f"{stageSummary['maxWallTime']:.3f}",
+			f"{stageSummary['cpuTime']:.3f}",
+			f"{stageSummary['childCpuTime']:.3f}",
+			f"{stageSummary['peakRSS']:.1f}",
+			f"{stageSummary['childPeakRSSGrowth']:.1f}",
+			stageSummary["maxWallTimeTree"]
+		]) + "\n")
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	infiles, outfile = parseArgs(sys.argv[0], sys.argv[1:])
+
+	profileFiles = getProfileFiles(infiles)
+	if len(profileFiles) == 0:
+		print("No profile files found.", file=sys.stderr)
+		sys.exit(1)
+
+	summary = summarizeProfiles(profileFiles)
+
+	if outfile != "":
+		with open(outfile, "w") as outFile:
+			writeSummary(summary, len(profileFiles), outFile)
+	else:
+		writeSummary(summary, len(profileFiles), sys.stdout)
+
+###############################################################################
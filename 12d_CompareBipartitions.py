@@ -0,0 +1,360 @@
+#!/bin/python3
+
+import os # Strip extension from file
+import re
+import sys, getopt # Parse program arguments
+import glob # Expand input tree patterns
+
+import numpy as np
+
+###############################################################################
+def usage(progName):
+	print(progName, "compares the bipartitions of many trees, for instance of all part trees")
+	print("and iterations of a gene. The bipartitions of each tree are stored as bitsets")
+	print("over one leaf index for all trees. For each tree the Robinson-Foulds distance to")
+	print("the reference tree and whether each clade is monophyletic are written to")
+	print("<outPrefix>.Trees.tsv, for each clade how often it is recovered to <outPrefix>.Clades.tsv.")
+	print("Trees with different leaves are compared on their common leaves.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -i, --infile              <infile>        A tree file, this option can be given several times')
+	print('                                           and may be a quoted glob pattern, such as "dir/*.treefile".')
+	print(' -c, --cladeMembers        <cladeMembers>  The clade members file written next to the clade trees of the master tree,')
+	print('                                           such as master.treefile.Clades.cladeMembers.tsv.')
+	print(' -r, --reference           <referenceTree> The tree to compare the other trees with, default is the master tree')
+	print('                                           of the clade members file, if it exists.')
+	print(' -o, --outPrefix           <outPrefix>     The prefix of the output files.')
+	print(' -p, --pairwise                            Also writes the Robinson-Foulds distances between all trees')
+	print('                                           to <outPrefix>.RF.tsv.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	infiles       = []
+	cladeMembers  = ""
+	referenceTree = ""
+	outPrefix     = ""
+	pairwise      = False
+
+	try:
+		opts, args = getopt.getopt(argv,"hpi:c:r:o:",["help", "pairwise", "infile=", "cladeMembers=", "reference=", "outPrefix="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-i", "--infile"):
+			infiles.append(arg)
+		elif opt in ("-c", "--cladeMembers"):
+			cladeMembers = arg
+		elif opt in ("-r", "--reference"):
+			referenceTree = arg
+		elif opt in ("-o", "--outPrefix"):
+			outPrefix = arg
+		elif opt in ("-p", "--pairwise"):
+			pairwise = True
+
+	if len(infiles) == 0 or outPrefix == "":
+		usage(progName)
+		sys.exit(2)
+
+	if referenceTree == "" and cladeMembers != "":
+		# The clade members file is <masterTree>.<cladeBase>.cladeMembers.tsv
+		masterTree = os.path.splitext(os.path.splitext(os.path.splitext(cladeMembers)[0])[0])[0]
+		if os.path.isfile(masterTree):
+			referenceTree = masterTree
+
+	return infiles, cladeMembers, referenceTree, outPrefix, pairwise
+
+###############################################################################
+# A label is everything between the structure characters, quoted names may contain them
+newickTokenPattern = re.compile(r"'[^']*'|[(),;]|[^(),;']+")
+
+# The characters ete3 replaces in the leaf names of the clade members
+newickNamePattern = re.compile("[:;(),\\[\\]\t\n\r=]")
+
+###############################################################################
+def getLeafName(label):
+	# The name as in the clade members file, where ete3 wrote it
+	label = label.strip()
+	if label.startswith("'"):
+		name = label[1:label.index("'", 1)]
+	else:
+		name = label.split(":")[0]
+
+	return newickNamePattern.sub("_", name.replace("'", ""))
+
+###############################################################################
+def readClusters(treeFile, leafIndex):
+	# Reads the first tree of a Newick file without building a tree. Returns the leaf
+	# names and for each inner node the leaves below it as a Python integer bitset
+	# over the shared leaf index, new leaves are added to the index.
+	with open(treeFile, "r") as treeIn:
+		newick = treeIn.read()
+
+	leafNames = []
+	clusters  = []
+	stack     = []
+	current   = 0
+	# The last structure character decides what a label belongs to
+	previous  = ""
+	label     = ""
+	for match in newickTokenPattern.finditer(newick):
+		token = match.group()
+		if token in "(),;":
+			if label != "" and previous in ("(", ",", ""):
+				# A leaf
+				leafName = getLeafName(label)
+				current |= 1 << leafIndex.getPosition(leafName)
+				leafNames.append(leafName)
+			label = ""
+
+			if token == "(":
+				stack.append(current)
+				current = 0
+			elif token == ",":
+				stack[-1] |= current
+				current = 0
+			elif token == ")":
+				current |= stack.pop()
+				clusters.append(current)
+			else:
+				break
+
+			previous = token
+		else:
+			label += token
+
+	return leafNames, clusters
+
+###############################################################################
+class LeafIndex:
+	# Maps the leaf names of all trees to bit positions
+	def __init__(self):
+		self.names = {}
+
+	def getPosition(self, name):
+		position = self.names.get(name)
+		if position == None:
+			position = len(self.names)
+			self.names[name] = position
+		return position
+
+	def add(self, names):
+		for name in names:
+			self.getPosition(name)
+
+	def getNumWords(self):
+		return (len(self.names) + 63) // 64
+
+	def toBitset(self, names):
+		bitset = np.zeros(self.getNumWords(), dtype=np.uint64)
+		positions = np.array([self.names[name] for name in names], dtype=np.uint64)
+		np.bitwise_or.at(bitset, positions // np.uint64(64), np.uint64(1) << (positions % np.uint64(64)))
+		return bitset
+
+###############################################################################
+def getPopCounts(bitsets):
+	if hasattr(np, "bitwise_count"):
+		return np.bitwise_count(bitsets).sum(axis=-1, dtype=np.int64)
+
+	return np.unpackbits(bitsets.view(np.uint8), axis=-1).sum(axis=-1, dtype=np.int64)
+
+###############################################################################
+def getFirstBit(bitset):
+	# The word and the bit of the first leaf in the bitset
+	word = np.flatnonzero(bitset)[0]
+	value = int(bitset[word])
+	return word, np.uint64(value & -value)
+
+###############################################################################
+class TreeBipartitions:
+	def __init__(self, treeFile, leafIndex):
+		leafNames, clusters = readClusters(treeFile, leafIndex)
+		if len(set(leafNames)) != len(leafNames):
+			raise ValueError("The tree has duplicated leaf names: " + treeFile)
+
+		self.treeFile  = treeFile
+		self.leafNames = leafNames
+		self.leafMask  = leafIndex.toBitset(leafNames)
+
+		# The Python integers as rows of 64 bit words
+		numWords    = leafIndex.getNumWords()
+		clusterBits = np.frombuffer(b"".join(cluster.to_bytes(numWords * 8, "little") for cluster in clusters), dtype="<u8")
+		clusterBits = clusterBits.astype(np.uint64).reshape(len(clusters), numWords)
+
+		self.bipartitions = getBipartitions(clusterBits, self.leafMask)
+
+	def resize(self, numWords):
+		# The leaf index grew since the tree was read
+		if self.leafMask.shape[-1] < numWords:
+			self.leafMask     = np.pad(self.leafMask, (0, numWords - self.leafMask.shape[-1]))
+			self.bipartitions = np.pad(self.bipartitions, ((0, 0), (0, numWords - self.bipartitions.shape[-1])))
+
+###############################################################################
+def getBipartitions(clusters, leafMask):
+	# The unique non trivial bipartitions of the clusters restricted to the leaves in
+	# leafMask, each given by the side without the first leaf of the mask
+	if len(clusters) == 0:
+		return np.zeros((0, leafMask.shape[-1]), dtype=np.uint64)
+
+	restricted = clusters & leafMask
+	firstWord, firstBit = getFirstBit(leafMask)
+	hasFirstLeaf = (restricted[:, firstWord] & firstBit) != 0
+	restricted[hasFirstLeaf] ^= leafMask
+
+	numLeaves = int(getPopCounts(leafMask))
+	sizes = getPopCounts(restricted)
+	restricted = restricted[(sizes >= 2) & (sizes <= numLeaves - 2)]
+
+	return getUniqueRows(restricted)
+
+###############################################################################
+def getRowView(bitsets):
+	# Each row as one value, sorting and comparing these is much faster than along an axis
+	bitsets = np.ascontiguousarray(bitsets)
+	return bitsets.view(np.dtype((np.void, bitsets.shape[1] * 8))).ravel()
+
+###############################################################################
+def getUniqueRows(bitsets):
+	return np.unique(getRowView(bitsets)).view(np.uint64).reshape(-1, bitsets.shape[1])
+
+###############################################################################
+def getRobinsonFoulds(tree1, tree2):
+	# The distance on the common leaves and the normalized distance
+	commonMask = tree1.leafMask & tree2.leafMask
+	numCommon  = int(getPopCounts(commonMask))
+	if numCommon < 4:
+		return 0, numCommon, float("nan")
+
+	# Trees with the same leaves need no restriction
+	bipartitions1 = tree1.bipartitions if np.array_equal(commonMask, tree1.leafMask) else getBipartitions(tree1.bipartitions, commonMask)
+	bipartitions2 = tree2.bipartitions if np.array_equal(commonMask, tree2.leafMask) else getBipartitions(tree2.bipartitions, commonMask)
+
+	numShared = len(np.intersect1d(getRowView(bipartitions1), getRowView(bipartitions2), assume_unique=True))
+
+	distance = len(bipartitions1) + len(bipartitions2) - 2 * numShared
+	return distance, numCommon, distance / (2 * (numCommon - 3))
+
+###############################################################################
+def isMonophyletic(tree, cladeMask):
+	# None if the tree has too few or too many of the clade leaves to tell
+	members = cladeMask & tree.leafMask
+	numMembers = int(getPopCounts(members))
+	if numMembers < 2 or numMembers > len(tree.leafNames) - 2:
+		return None
+
+	bipartition = getBipartitions(members[np.newaxis, :], tree.leafMask)[0]
+	return bool(np.any(np.all(tree.bipartitions == bipartition, axis=1)))
+
+###############################################################################
+def loadCladeMembers(cladeMembersFile):
+	# The clade name and the leaf names of each clade, some clades may
+	# have been written more than once, their members are merged
+	cladeMembers = {}
+	with open(cladeMembersFile, "r") as cladeMembersIn:
+		for line in cladeMembersIn:
+			splitLine = line.rstrip("\n").split("\t")
+			cladeMembers.setdefault(splitLine[0], []).extend(splitLine[1:])
+
+	return cladeMembers
+
+###############################################################################
+def getTreeFiles(infiles):
+	treeFiles = []
+	for pattern in infiles:
+		matches = sorted(glob.glob(pattern))
+		if len(matches) == 0:
+			print("No tree file matches", pattern, file=sys.stderr)
+		treeFiles.extend(matches)
+
+	return treeFiles
+
+###############################################################################
+def formatDistance(distance, numCommon, normalized):
+	if np.isnan(normalized):
+		return ["NA", str(numCommon), "NA"]
+
+	return [str(distance), str(numCommon), f"{normalized:.4f}"]
+
+###############################################################################
+def compareBipartitions(treeFiles, cladeMembersFile, referenceTree, outPrefix, pairwise):
+	leafIndex = LeafIndex()
+
+	if referenceTree != "" and referenceTree not in treeFiles:
+		treeFiles = [referenceTree] + treeFiles
+
+	trees = []
+	for treeFile in treeFiles:
+		trees.append(TreeBipartitions(treeFile, leafIndex))
+
+	cladeMembers = loadCladeMembers(cladeMembersFile) if cladeMembersFile != "" else {}
+	for members in cladeMembers.values():
+		leafIndex.add(members)
+
+	numWords = leafIndex.getNumWords()
+	for tree in trees:
+		tree.resize(numWords)
+
+	cladeNames = list(cladeMembers)
+	cladeMasks = [leafIndex.toBitset(cladeMembers[cladeName]) for cladeName in cladeNames]
+	reference  = trees[treeFiles.index(referenceTree)] if referenceTree != "" else None
+
+	numInformative   = [0] * len(cladeNames)
+	numMonophyletic  = [0] * len(cladeNames)
+
+	with open(outPrefix + ".Trees.tsv", "w") as treesOut:
+		treesOut.write("\t".join(["Tree", "NumLeaves", "NumBipartitions", "RF", "CommonLeaves", "NormalizedRF"] + cladeNames) + "\n")
+
+		for tree in trees:
+			distance = ["NA", "NA", "NA"]
+			if reference != None:
+				distance = formatDistance(*getRobinsonFoulds(tree, reference))
+
+			monophyly = []
+			for i, cladeMask in enumerate(cladeMasks):
+				isClade = isMonophyletic(tree, cladeMask)
+				if isClade == None:
+					monophyly.append("NA")
+					continue
+
+				numInformative[i] += 1
+				if isClade:
+					numMonophyletic[i] += 1
+				monophyly.append("yes" if isClade else "no")
+
+			treesOut.write("\t".join([tree.treeFile, str(len(tree.leafNames)), str(len(tree.bipartitions))] + distance + monophyly) + "\n")
+
+	with open(outPrefix + ".Clades.tsv", "w") as cladesOut:
+		cladesOut.write("Clade\tNumMembers\tNumTrees\tNumMonophyletic\tRecoveryFrequency\n")
+		for i, cladeName in enumerate(cladeNames):
+			frequency = f"{numMonophyletic[i] / numInformative[i]:.4f}" if numInformative[i] > 0 else "NA"
+			cladesOut.write("\t".join([cladeName, str(len(cladeMembers[cladeName])), str(numInformative[i]), str(numMonophyletic[i]), frequency]) + "\n")
+
+	if pairwise:
+		with open(outPrefix + ".RF.tsv", "w") as rfOut:
+			rfOut.write("\t".join(["Tree"] + [tree.treeFile for tree in trees]) + "\n")
+			for tree1 in trees:
+				distances = []
+				for tree2 in trees:
+					distance, numCommon, normalized = getRobinsonFoulds(tree1, tree2)
+					distances.append(str(distance) if not np.isnan(normalized) else "NA")
+				rfOut.write("\t".join([tree1.treeFile] + distances) + "\n")
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	infiles, cladeMembersFile, referenceTree, outPrefix, pairwise = parseArgs(sys.argv[0], sys.argv[1:])
+
+	treeFiles = getTreeFiles(infiles)
+	if len(treeFiles) == 0 and referenceTree == "":
+		print("No tree files found.", file=sys.stderr)
+		sys.exit(1)
+
+	compareBipartitions(treeFiles, cladeMembersFile, referenceTree, outPrefix, pairwise)
+
+###############################################################################
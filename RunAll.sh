@@ -124,6 +124,11 @@ do
         -M)
             ignoreIfMasterFileDoesNotExist="-X"
             ;;
+        --preFilterRogues)
+            ;&
+        -R)
+            preFilterRogues="--preFilter"
+            ;;
         -*)
             ;&
         --*)
@@ -281,12 +286,12 @@ case $step in
 	do
 		if [ -f $ufbootFile ]
 		then
-			"$DIR/11_RemoveRogues.sh" -g "$gene" -f "$ufbootFile" -a "$aligner" -i "$iteration" $suffix $previousAligner
+			"$DIR/11_RemoveRogues.sh" -g "$gene" -f "$ufbootFile" -a "$aligner" -i "$iteration" $suffix $previousAligner $preFilterRogues
 		fi
 	done
 	if [ -f $AllSeqsUFBoot ]
 	then
-		"$DIR/11_RemoveRogues.sh" -g "$gene" -f $AllSeqsUFBoot -a "$aligner" -i "$iteration" $suffix $previousAligner
+		"$DIR/11_RemoveRogues.sh" -g "$gene" -f $AllSeqsUFBoot -a "$aligner" -i "$iteration" $suffix $previousAligner $preFilterRogues
 		hasFullFile="--hasFullFile"
 	fi
 	"$DIR/11b_ExtractNonRogues.sh" -g "$gene" -a "$aligner" -i "$iteration" $shuffleSeqs $suffix $previousAligner $restore $hasFullFile
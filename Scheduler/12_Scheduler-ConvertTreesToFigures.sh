@@ -6,6 +6,7 @@
 # Go to the first program line,
 # any PBS directive below that is ignored.
 # No modules to load, we use the standard python3
+# The compute nodes have no display, the trees are rendered offscreen
 
 thisScript="$(basename "$(test -L "$0" && readlink "$0" || echo "$0")")"
 
@@ -96,6 +96,11 @@ do
             shift
             trimAl="-t $1"
             ;;
+        --preFilterRogues)
+            ;&
+        -R)
+            preFilterRogues="-R"
+            ;;
         -*)
             ;&
         --*)
@@ -121,6 +126,7 @@ echo "suffix:           $suffix"           >&2
 echo "extension:        $extension"        >&2
 echo "previousAligner:  $previousAligner"  >&2
 echo "trimAl:           $trimAl"           >&2
+echo "preFilterRogues:  $preFilterRogues"  >&2
 echo "Note the script is copied to"        >&2
 echo "another place with another name"     >&2
 
@@ -151,7 +157,7 @@ jobIDs=$($DIR/Scheduler-Call.sh             -g "$gene" -s "9" -i "$iteration" -a
 echo $jobIDs
 
 # Schedule tree reconstruction, can only run when all alignments are ready
-"$DIR/Scheduler-Sub.sh" -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, numRoundsLeft=$numRoundsLeft, bigNumRoundsLeft=$bigNumRoundsLeft, shuffleSeqs=$shuffleSeqs, allSeqs=$allSeqs, suffix=$suffix, extension=$extension, previousAligner=$previousAligner, trimAl=$trimAl, bigTreeIteration=$bigTreeIteration" -W "depend=afterok$jobIDs" \
+"$DIR/Scheduler-Sub.sh" -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, numRoundsLeft=$numRoundsLeft, bigNumRoundsLeft=$bigNumRoundsLeft, shuffleSeqs=$shuffleSeqs, allSeqs=$allSeqs, suffix=$suffix, extension=$extension, previousAligner=$previousAligner, trimAl=$trimAl, bigTreeIteration=$bigTreeIteration, preFilterRogues=$preFilterRogues" -W "depend=afterok$jobIDs" \
     "$DIR/Scheduler-10-RogueOptTree.sh"
 
 # Start held jobs
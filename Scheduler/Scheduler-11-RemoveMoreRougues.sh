@@ -96,6 +96,11 @@ do
             shift
             trimAl="-t $1"
             ;;
+        --preFilterRogues)
+            ;&
+        -R)
+            preFilterRogues="-R"
+            ;;
         -*)
             ;&
         --*)
@@ -121,6 +126,7 @@ echo "suffix:           $suffix"           >&2
 echo "extension:        $extension"        >&2
 echo "previousAligner:  $previousAligner"  >&2
 echo "trimAl:           $trimAl"           >&2
+echo "preFilterRogues:  $preFilterRogues"  >&2
 echo "Note the script is copied to"        >&2
 echo "another place with another name"     >&2
 
@@ -171,7 +177,7 @@ then
 		previousAligner="-p $aligner.$oldSuffix"
 	fi
 
-	"$DIR/Scheduler-Sub.sh" -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, numRoundsLeft=$bigNumRoundsLeft, shuffleSeqs=$shuffleSeqs, allSeqs=$allSeqs, suffix=$suffix, extension=$extension, previousAligner=$previousAligner, trimAl=$trimAl" \
+	"$DIR/Scheduler-Sub.sh" -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, numRoundsLeft=$bigNumRoundsLeft, shuffleSeqs=$shuffleSeqs, allSeqs=$allSeqs, suffix=$suffix, extension=$extension, previousAligner=$previousAligner, trimAl=$trimAl, preFilterRogues=$preFilterRogues" \
 	    "$DIR/Scheduler-09-RogueOptAlign.sh"
 	allSeqs=$oldAllSeqs
 	suffix=$olfSuffix
@@ -222,4 +228,4 @@ fi
 # This seems to be in the environment with Slurm
 # So set it to the empty string, since it should not be passed on
 previousAligner=""
-"$DIR/Scheduler-09-RogueOptAlign.sh" -g "$gene" -i "$nextIteration" -a "$aligner" -n "$numRoundsLeft" $bigTreeIteration $bigNumRoundsLeft $shuffleSeqs $allSeqs $suffix $extension $trimAl
+"$DIR/Scheduler-09-RogueOptAlign.sh" -g "$gene" -i "$nextIteration" -a "$aligner" -n "$numRoundsLeft" $bigTreeIteration $bigNumRoundsLeft $shuffleSeqs $allSeqs $suffix $extension $trimAl $preFilterRogues
@@ -128,6 +128,11 @@ do
         -M)
             ignoreIfMasterFileDoesNotExist="-M"
             ;;
+        --preFilterRogues)
+            ;&
+        -R)
+            preFilterRogues="-R"
+            ;;
         --folder)
             ;&
         -f)
@@ -267,7 +272,7 @@ case $step in
 	fi
 	;;
 11)
-	jobIDs+=:$("$DIR/Scheduler-Sub.sh" $hold $depend -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, shuffleSeqs=$shuffleSeqs, suffix=$suffix, previousAligner=$previousAligner, restore=$restore" "$DIR/11_Scheduler-RemoveRogues.sh")
+	jobIDs+=:$("$DIR/Scheduler-Sub.sh" $hold $depend -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, shuffleSeqs=$shuffleSeqs, suffix=$suffix, previousAligner=$previousAligner, restore=$restore, preFilterRogues=$preFilterRogues" "$DIR/11_Scheduler-RemoveRogues.sh")
 	;;
 12)
 	jobIDs+=:$("$DIR/Scheduler-Sub.sh" $hold $depend -v "DIR=$DIR, gene=$gene, iteration=$iteration, aligner=$aligner, suffix=$suffix, extension=$extension, update=$update, updateBig=$updateBig, inputDir=$inputDir, ignoreIfMasterFileDoesNotExist=$ignoreIfMasterFileDoesNotExist" "$DIR/12_Scheduler-ConvertTreesToFigures.sh")
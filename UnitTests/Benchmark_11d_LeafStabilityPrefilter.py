@@ -0,0 +1,190 @@
+#!/bin/python3
+
+# Benchmark of 11d_LeafStabilityPrefilter.py against RogueNaRok on the same
+# synthetic bootstrap trees with known rogues, for instance:
+# python3 UnitTests/Benchmark_11d_LeafStabilityPrefilter.py -l 100,500,2000 -t 1000 -k 5
+# python3 UnitTests/Benchmark_11d_LeafStabilityPrefilter.py -l 500 -r ../RogueNaRok/RogueNaRok-parallel -T 8
+
+import importlib.util
+import os
+import random
+import shutil
+import subprocess
+import sys, getopt # Parse program arguments
+import tempfile
+import time
+
+scriptDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+###############################################################################
+def loadScript():
+	# The script name starts with a digit, so it cannot be imported directly
+	spec = importlib.util.spec_from_file_location("LeafStabilityPrefilter", os.path.join(scriptDir, "11d_LeafStabilityPrefilter.py"))
+	script = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(script)
+	return script
+
+###############################################################################
+def buildTree(leafNames, rng):
+	# A random tree as nested lists, split unevenly at random,
+	# so that the depth stays logarithmic
+	if len(leafNames) == 1:
+		return leafNames[0]
+
+	split = max(1, int(len(leafNames) * rng.uniform(0.25, 0.75)))
+	return [buildTree(leafNames[:split], rng), buildTree(leafNames[split:], rng)]
+
+###############################################################################
+def copyTree(tree):
+	return [copyTree(child) for child in tree] if isinstance(tree, list) else tree
+
+###############################################################################
+def getEdges(tree):
+	# The parent and the child index of every node but the root
+	edges = []
+	stack = [tree]
+	while len(stack) > 0:
+		node = stack.pop()
+		for i, child in enumerate(node):
+			edges.append((node, i))
+			if isinstance(child, list):
+				stack.append(child)
+	return edges
+
+###############################################################################
+def writeNewick(tree):
+	if not isinstance(tree, list):
+		return tree + ":0.1"
+	return "(" + ",".join(writeNewick(child) for child in tree) + "):0.1"
+
+###############################################################################
+def generateTrees(treeFile, numLeaves, numTrees, numRogues, numNNIs, seed=1):
+	# Bootstrap like trees: the same base tree with a few random nearest neighbour
+	# interchanges, and the rogues attached to a random edge in each tree
+	rng = random.Random(seed)
+	leafNames = ["ID%05d" % i for i in range(numLeaves)]
+	rogues = rng.sample(leafNames, numRogues)
+	base = buildTree([leafName for leafName in leafNames if leafName not in rogues], rng)
+
+	with open(treeFile, "w") as treesOut:
+		for t in range(numTrees):
+			tree = copyTree(base)
+
+			innerEdges = [(parent, i) for parent, i in getEdges(tree) if isinstance(parent[i], list)]
+			for parent, i in rng.sample(innerEdges, min(numNNIs, len(innerEdges))):
+				# An earlier interchange may have moved the node
+				child = parent[i]
+				if not isinstance(child, list):
+					continue
+				j = rng.randrange(len(child))
+				k = rng.choice([k for k in range(len(parent)) if k != i])
+				child[j], parent[k] = parent[k], child[j]
+
+			for rogue in rogues:
+				parent, i = rng.choice(getEdges(tree))
+				parent[i] = [parent[i], rogue]
+
+			treesOut.write(writeNewick(tree)[:-4] + ";\n")
+
+	return rogues
+
+###############################################################################
+def runRogueNaRok(rogueNaRok, treeFile, name, workDir, numThreads):
+	# As in 11_RemoveRogues.sh, returns the runtime and the dropped taxa
+	start = time.perf_counter()
+	subprocess.run([rogueNaRok, "-s", "2", "-i", treeFile, "-n", name, "-w", workDir, "-T", str(numThreads)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+	runTime = time.perf_counter() - start
+
+	dropped = []
+	with open(os.path.join(workDir, "RogueNaRok_droppedRogues." + name), "r") as droppedIn:
+		next(droppedIn)
+		for line in droppedIn:
+			splitLine = line.rstrip("\n").split("\t")
+			if len(splitLine) > 2 and splitLine[2] != "NA":
+				dropped.extend(splitLine[2].split(","))
+
+	return runTime, dropped
+
+###############################################################################
+def getRecall(found, rogues):
+	return f"{len(set(found) & set(rogues))}/{len(rogues)}"
+
+###############################################################################
+def benchmarkPrefilter(script, leafCounts, numTrees, numRogues, rogueNaRok, numThreads):
+	print("Leaves\tTrees\tMethod\tTime(s)\tFound\tFalse")
+	for numLeaves in leafCounts:
+		with tempfile.TemporaryDirectory() as workDir:
+			treeFile = os.path.join(workDir, "Benchmark.ufboot")
+			rogues = generateTrees(treeFile, numLeaves, numTrees, numRogues, max(1, numLeaves // 50))
+
+			start = time.perf_counter()
+			candidates = script.rankLeaves(treeFile, os.path.join(workDir, "LeafStability"), 3.5, 2.0, 0, os.path.join(workDir, "Pruned.ufboot"))
+			runTime = time.perf_counter() - start
+			print(numLeaves, numTrees, "prefilter", f"{runTime:.3f}", getRecall(candidates, rogues), len(set(candidates) - set(rogues)), sep="\t")
+
+			if rogueNaRok == "":
+				continue
+
+			runTime, dropped = runRogueNaRok(rogueNaRok, treeFile, "full", workDir, numThreads)
+			print(numLeaves, numTrees, "RogueNaRok", f"{runTime:.3f}", getRecall(dropped, rogues), len(set(dropped) - set(rogues)), sep="\t")
+
+			runTime, dropped = runRogueNaRok(rogueNaRok, os.path.join(workDir, "Pruned.ufboot"), "pruned", workDir, numThreads)
+			print(numLeaves, numTrees, "RogueNaRok after prefilter", f"{runTime:.3f}", getRecall(dropped + candidates, rogues), len(set(dropped + candidates) - set(rogues)), sep="\t")
+
+###############################################################################
+def usage(progName):
+	print(progName, "benchmarks 11d_LeafStabilityPrefilter.py and RogueNaRok on synthetic bootstrap trees with known rogues.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -l, --leaves              <numbers>       The comma separated tree sizes, default 100,500,2000.')
+	print(' -t, --trees               <number>        The number of trees per set, default 1000.')
+	print(' -k, --rogues              <number>        The number of rogues per set, default 5.')
+	print(' -r, --rogueNaRok          <file>          The RogueNaRok binary, default ../RogueNaRok/RogueNaRok-parallel')
+	print('                                           if it exists, without RogueNaRok only the prefilter is run.')
+	print(' -T, --threads             <number>        The number of threads for RogueNaRok, default are the available CPUs.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	leafCounts = [100, 500, 2000]
+	numTrees   = 1000
+	numRogues  = 5
+	rogueNaRok = os.path.join(os.path.dirname(scriptDir), "RogueNaRok", "RogueNaRok-parallel")
+	numThreads = len(os.sched_getaffinity(0))
+
+	try:
+		opts, args = getopt.getopt(argv,"hl:t:k:r:T:",["help", "leaves=", "trees=", "rogues=", "rogueNaRok=", "threads="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-l", "--leaves"):
+			leafCounts = [int(numLeaves) for numLeaves in arg.split(",")]
+		elif opt in ("-t", "--trees"):
+			numTrees = int(arg)
+		elif opt in ("-k", "--rogues"):
+			numRogues = int(arg)
+		elif opt in ("-r", "--rogueNaRok"):
+			rogueNaRok = arg
+		elif opt in ("-T", "--threads"):
+			numThreads = int(arg)
+
+	if not os.path.isfile(rogueNaRok):
+		rogueNaRok = shutil.which(rogueNaRok) or shutil.which("RogueNaRok-parallel") or shutil.which("RogueNaRok") or ""
+		if rogueNaRok == "":
+			print("RogueNaRok not found, only the prefilter is run.", file=sys.stderr)
+
+	return leafCounts, numTrees, numRogues, rogueNaRok, numThreads
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	leafCounts, numTrees, numRogues, rogueNaRok, numThreads = parseArgs(sys.argv[0], sys.argv[1:])
+	benchmarkPrefilter(loadScript(), leafCounts, numTrees, numRogues, rogueNaRok, numThreads)
+
+###############################################################################
@@ -0,0 +1,413 @@
+#!/bin/python3
+
+# Benchmarks for 12_ConvertTreesToFigures.py
+# Run from the base folder, so that the species database is found, for instance:
+# python3 UnitTests/Benchmark_12_ConvertTreesToFigures.py -b linage -z Opsins/InterestingTaxa.csv
+# python3 UnitTests/Benchmark_12_ConvertTreesToFigures.py -b render -t Opsins/SequencesOfInterest.alignment.FAMSA.treefile
+# python3 UnitTests/Benchmark_12_ConvertTreesToFigures.py -b logoCounts -c 150
+# python3 UnitTests/Benchmark_12_ConvertTreesToFigures.py -b startup -s ../PhylogenyPipelineOld/12_ConvertTreesToFigures.py -a "-i part.treefile -c Clades.csv -t master.cladeTrees"
+# python3 UnitTests/Benchmark_12_ConvertTreesToFigures.py -b stages -l 1000,10000 -o stages.json -p previousStages.json
+
+import importlib.util
+import json
+import os
+import random
+import shlex
+import subprocess
+import sys, getopt # Parse program arguments
+import time
+import numpy as np
+
+scriptDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+###############################################################################
+def loadScript():
+	# The script name starts with a digit, so it cannot be imported directly
+	spec = importlib.util.spec_from_file_location("ConvertTreesToFigures", os.path.join(scriptDir, "12_ConvertTreesToFigures.py"))
+	script = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(script)
+	return script
+
+###############################################################################
+def getMostFrequentRanks(genusDatabase, numTaxa):
+	rankCounts = {}
+	with open(genusDatabase, 'rt') as genusFile:
+		for line in genusFile:
+			splitLine = line.split("\t")
+			for rank in splitLine[2].split(";"):
+				rank = rank.strip()
+				if rank != "":
+					rankCounts[rank] = rankCounts.get(rank, 0) + 1
+
+	return sorted(rankCounts, key=rankCounts.get, reverse=True)[:numTaxa]
+
+###############################################################################
+def benchmarkLinageMatcher(script, genusDatabase, iterestingTaxa, numTaxa):
+	if iterestingTaxa != "":
+		script.loadColorMap(iterestingTaxa, script.taxonColorMap)
+		regularTaxa = [taxon for taxon in script.taxonColorMap if script.taxonColorMap[taxon].entryType == script.type_regular]
+	else:
+		regularTaxa = getMostFrequentRanks(genusDatabase, numTaxa)
+
+	genusLinages = list(script.readGenusLinagesFromFile(genusDatabase))
+
+	print("Genera:", len(genusLinages), "taxa:", len(regularTaxa))
+
+	# The loop as it was before, one substring search per taxon and line
+	start = time.perf_counter()
+	loopMap = {}
+	for genus, linage in genusLinages:
+		for taxon in regularTaxa:
+			checkString = " " + taxon + ";"
+			if checkString in linage:
+				loopMap[genus] = taxon
+	loopTime = time.perf_counter() - start
+
+	start = time.perf_counter()
+	matcherMap = {}
+	linageMatcher = script.MultiPatternMatcher([" " + taxon + ";" for taxon in regularTaxa], regularTaxa)
+	for genus, linage in genusLinages:
+		taxon = linageMatcher.findLast(linage)
+		if taxon is not None:
+			matcherMap[genus] = taxon
+	matcherTime = time.perf_counter() - start
+
+	print(f"Loop:    {loopTime:10.3f} s")
+	print(f"Matcher: {matcherTime:10.3f} s")
+	print("Same result:", loopMap == matcherMap)
+
+###############################################################################
+def renderVariants(script, inputTree, outDir, copyTree):
+	from ete3 import TreeStyle
+
+	tree = script.loadTree(inputTree)
+	script.annotateLeafCounts(tree)
+	script.annotateSupportValues(tree)
+	for node in tree.traverse():
+		node.cladeName = ""
+
+	ts = TreeStyle()
+	ts.layout_fn = script.fullTreeLayout
+	ts.show_leaf_name = False
+
+	# Six renderings like in convertTreeToFigures
+	for i in range(6):
+		renderTree = tree.copy() if copyTree else tree
+		renderTree.render(os.path.join(outDir, "Variant" + str(i) + ".pdf"), dpi=600, w=183, units="mm", tree_style=ts)
+
+###############################################################################
+def benchmarkRender(script, inputTree):
+	import tempfile
+
+	if inputTree == "":
+		print("The render benchmark needs a tree file, given with -t.", file=sys.stderr)
+		sys.exit(2)
+
+	with tempfile.TemporaryDirectory() as outDir:
+		for copyTree in [True, False]:
+			# Fork, so that each run gets its own peak memory
+			start = time.perf_counter()
+			pid = os.fork()
+			if pid == 0:
+				renderVariants(script, inputTree, outDir, copyTree)
+				os._exit(0)
+
+			pid, status, usage = os.wait4(pid, 0)
+			elapsed = time.perf_counter() - start
+
+			# ru_maxrss is in kilobytes on Linux
+			label = "Copy:    " if copyTree else "No copy: "
+			print(f"{label}{elapsed:10.3f} s {usage.ru_maxrss / 1024:10.1f} MB peak")
+
+###############################################################################
+class RandomAlignmentData:
+	def __init__(self, numSeqs, length):
+		rng = np.random.default_rng(1)
+		aminoAcids = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY-", dtype=np.uint8)
+		self.residues = aminoAcids[rng.integers(0, len(aminoAcids), size=(numSeqs, length))]
+
+###############################################################################
+def benchmarkLogoCounts(script, numClades):
+	import logomaker
+	script.importLogoModules()
+
+	alignmentData = RandomAlignmentData(numClades * 50, 1000)
+	cladeRows = [list(range(clade * 50, (clade + 1) * 50)) for clade in range(numClades)]
+	columns = list(range(400, 430))
+
+	print("Clades:", numClades, "sequences:", alignmentData.residues.shape[0], "columns:", len(columns))
+
+	# As before, a string per sequence and a count matrix per clade
+	start = time.perf_counter()
+	loopMatrices = []
+	for rows in cladeRows:
+		sequences = [alignmentData.residues[row, columns].tobytes().decode("ascii") for row in rows]
+		loopMatrices.append(logomaker.alignment_to_matrix(sequences))
+	loopTime = time.perf_counter() - start
+
+	start = time.perf_counter()
+	chars, counts = script.countResiduesOfClades(alignmentData, cladeRows, columns)
+	engineMatrices = [script.getCountMatrix(chars, counts[i], len(rows)) for i, rows in enumerate(cladeRows)]
+	engineTime = time.perf_counter() - start
+
+	print(f"Loop:    {loopTime:10.3f} s")
+	print(f"Engine:  {engineTime:10.3f} s")
+	print("Same result:", all(loop.equals(engine) for loop, engine in zip(loopMatrices, engineMatrices)))
+
+###############################################################################
+def benchmarkStartup(baselineScript, arguments, numRepeats):
+	scripts = [os.path.join(scriptDir, "12_ConvertTreesToFigures.py")]
+	if baselineScript != "":
+		scripts.insert(0, baselineScript)
+
+	for script in scripts:
+		times = []
+		for i in range(numRepeats):
+			start = time.perf_counter()
+			subprocess.run([sys.executable, script] + shlex.split(arguments), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+			times.append(time.perf_counter() - start)
+
+		print(f"{min(times):10.3f} s min {sum(times) / len(times):10.3f} s mean", script)
+
+###############################################################################
+def writeNewickTree(treeFile, leafNames, rng):
+	# A random tree with IQ-Tree style SH-aLRT/aBayes/UFBoot labels, split
+	# unevenly at random, so that the depth stays logarithmic
+	def getSubtree(first, last):
+		if last - first == 1:
+			return leafNames[first] + ":" + f"{rng.random():.4f}"
+
+		split = first + max(1, int((last - first) * rng.uniform(0.25, 0.75)))
+		label = f"{rng.uniform(50, 100):.1f}/{rng.uniform(0.5, 1):.3f}/{rng.randint(50, 100)}"
+		return "(" + getSubtree(first, split) + "," + getSubtree(split, last) + ")" + label + ":" + f"{rng.random():.4f}"
+
+	numLeaves = len(leafNames)
+	outgroupSplit = max(1, numLeaves // 20)
+	with open(treeFile, "w") as treeOut:
+		treeOut.write("(" + getSubtree(0, numLeaves - outgroupSplit) + "," + getSubtree(numLeaves - outgroupSplit, numLeaves) + ");\n")
+
+###############################################################################
+def generateInputs(workDir, numLeaves, alignmentLength=300, numGenera=200, numClades=8, seed=1):
+	# Writes a synthetic data set for 12_ConvertTreesToFigures.py into workDir:
+	# the tree and its alignment, the clades, the reference sequence config,
+	# the interesting taxa, and a small fake lineage database
+	rng   = random.Random(seed)
+	nprng = np.random.default_rng(seed)
+
+	os.makedirs(os.path.join(workDir, "SpeciesDatabase"), exist_ok=True)
+	with open(os.path.join(scriptDir, "AminoAcidColorMap.csv"), "r") as colorMapIn, open(os.path.join(workDir, "AminoAcidColorMap.csv"), "w") as colorMapOut:
+		colorMapOut.write(colorMapIn.read())
+
+	groups = ["Chordata", "Arthropoda", "Mollusca", "Cnidaria", "Annelida"]
+	colors = ["Red", "Blue", "Green", "Orange", "Purple", "Brown", "Pink", "Black"]
+	genera = ["Genus" + str(i) for i in range(numGenera)]
+	with open(os.path.join(workDir, "SpeciesDatabase", "GenusLinage.csv"), "w") as genusOut:
+		for i in range(numGenera * 10):
+			genusOut.write(str(i) + "\tOther" + str(i) + "\tcellular organisms; Bacteria; Proteobacteria" + str(i % 7) + ";\n")
+		for i, genus in enumerate(genera):
+			genusOut.write(str(numGenera * 10 + i) + "\t" + genus + "\tcellular organisms; Eukaryota; Opisthokonta; Metazoa; " + groups[i % len(groups)] + "; Family" + str(i) + ";\n")
+
+	with open(os.path.join(workDir, "InterestingTaxa.csv"), "w") as taxaOut:
+		taxaOut.write("Metazoa\tBlack\ttitle\nAll\tBlack\ttotal\nIn\tBlack\tingroup\nOut\tBlack\toutgroup\n")
+		for i, group in enumerate(groups):
+			taxaOut.write(group + "\t" + colors[i] + "\tregular\t1\n")
+
+	leafNames = ["Seq" + str(i) + "_" + genera[rng.randrange(numGenera)] + "_species" + str(i) for i in range(numLeaves)]
+
+	# Each sequence is a mutated copy of the same sequence
+	aminoAcids = np.frombuffer(b"ACDEFGHIKLMNPQRSTVWY", dtype=np.uint8)
+	baseSequence = aminoAcids[nprng.integers(0, len(aminoAcids), size=alignmentLength)]
+	residues = np.tile(baseSequence, (numLeaves, 1))
+	randomValues = nprng.random(residues.shape)
+	mutations = randomValues < 0.1
+	residues[mutations] = aminoAcids[nprng.integers(0, len(aminoAcids), size=int(mutations.sum()))]
+	residues[(randomValues >= 0.1) & (randomValues < 0.13)] = ord("-")
+
+	alnFile = os.path.join(workDir, "SequencesOfInterest.alignment.FAMSA")
+	with open(alnFile, "w") as alnOut:
+		alnOut.write(" " + str(numLeaves) + " " + str(alignmentLength) + "\n")
+		for name, row in zip(leafNames, residues):
+			alnOut.write(name + " " + row.tobytes().decode("ascii") + "\n")
+
+	treeFile = alnFile + ".treefile"
+	writeNewickTree(treeFile, leafNames, rng)
+
+	# The leaves are in tree order, so evenly spaced leaves are in different clades
+	with open(os.path.join(workDir, "Clades.csv"), "w") as cladesOut:
+		for i in range(numClades):
+			cladeName = "Outgroup" if i == numClades - 1 else "Clade" + str(i)
+			cladesOut.write(leafNames[(2 * i + 1) * numLeaves // (2 * numClades)] + "\t" + cladeName + "\t" + colors[i % len(colors)] + "\tLightGrey\n")
+
+	refRow = residues[1]
+	with open(os.path.join(workDir, "Reference.fasta"), "w") as refOut:
+		refOut.write(">" + leafNames[1].split("_")[0] + "\n" + refRow[refRow != ord("-")].tobytes().decode("ascii") + "\n")
+	with open(os.path.join(workDir, "SpecialAminoAcids.txt"), "w") as configOut:
+		configOut.write("seqfile\tReference.fasta\naapos\t100\ntolowerlimit\t10\ntoupperlimit\t10\ninterestingaapositions\t20\t50\t100\t150\naatohighlight\t98\t102\nhighlightcolors\tRed\tBlue\n")
+
+	return os.path.basename(treeFile)
+
+###############################################################################
+def runStages(workDir, inputTree):
+	env = dict(os.environ)
+	env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+	start = time.perf_counter()
+	result = subprocess.run([sys.executable, os.path.join(scriptDir, "12_ConvertTreesToFigures.py"), "--profile", "-m", "-i", inputTree, "-c", "Clades.csv", "-f", "SpecialAminoAcids.txt", "-z", "InterestingTaxa.csv"], cwd=workDir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+	totalTime = time.perf_counter() - start
+	if result.returncode != 0:
+		print(result.stderr, file=sys.stderr)
+		return None
+
+	with open(os.path.join(workDir, inputTree + ".Clades.profile.json"), "r") as profileIn:
+		profile = json.load(profileIn)
+
+	# Stages that run more than once, such as determining the clades, are summed up
+	stageTimes = {"Total": totalTime}
+	for stage in profile["stages"]:
+		stageTimes[stage["stage"]] = stageTimes.get(stage["stage"], 0.0) + stage["wallTime"]
+
+	return stageTimes
+
+###############################################################################
+def benchmarkStages(leafCounts, resultsFile, previousResultsFile, maxSlowdown):
+	import tempfile
+
+	previousResults = {}
+	if previousResultsFile != "":
+		with open(previousResultsFile, "r") as previousIn:
+			previousResults = json.load(previousIn)
+
+	results = {}
+	numSlower = 0
+	for numLeaves in leafCounts:
+		with tempfile.TemporaryDirectory() as workDir:
+			start = time.perf_counter()
+			inputTree = generateInputs(workDir, numLeaves)
+			print(f"{numLeaves} leaves, inputs generated in {time.perf_counter() - start:.3f} s")
+
+			stageTimes = runStages(workDir, inputTree)
+			if stageTimes == None:
+				print("Processing the tree with", numLeaves, "leaves failed.", file=sys.stderr)
+				sys.exit(1)
+
+		results[str(numLeaves)] = stageTimes
+		previousTimes = previousResults.get(str(numLeaves), {})
+		for stage, stageTime in stageTimes.items():
+			line = f"  {stage:35s} {stageTime:10.3f} s"
+			if stage in previousTimes:
+				previousTime = previousTimes[stage]
+				line += f" {previousTime:10.3f} s before"
+				# Ignore short stages, their times are mostly noise
+				if stageTime > previousTime * (1 + maxSlowdown / 100) and stageTime - previousTime > 0.05:
+					line += " SLOWER"
+					numSlower += 1
+			print(line)
+
+	if resultsFile != "":
+		with open(resultsFile, "w") as resultsOut:
+			json.dump(results, resultsOut, indent="\t")
+			resultsOut.write("\n")
+
+	if numSlower > 0:
+		print(numSlower, "stages are more than", maxSlowdown, "% slower than before.", file=sys.stderr)
+		sys.exit(1)
+
+###############################################################################
+def usage(progName):
+	print(progName, "runs benchmarks for 12_ConvertTreesToFigures.py.\n")
+	print(' -h, --help                                Prints this help message.')
+	print(' -b, --benchmark           <name>          The benchmark to run: linage, render, logoCounts, startup, stages')
+	print(' -g, --genusDatabase       <file>          The genus lineage file, default SpeciesDatabase/GenusLinage.csv.')
+	print(' -z, --iterestingTaxa      <file>          The taxa to match, if not given the most frequent ranks are used.')
+	print(' -n, --numTaxa             <number>        The number of most frequent ranks to match, default 100.')
+	print(' -t, --tree                <file>          The tree to render in the render benchmark.')
+	print(' -c, --numClades           <number>        The number of clades in the logoCounts benchmark, default 150.')
+	print(' -s, --baseline            <script>        Another version of the script to compare with in the startup benchmark.')
+	print(' -a, --arguments           <arguments>     The arguments for the script in the startup benchmark, default -h.')
+	print(' -r, --repeats             <number>        The number of runs per script in the startup benchmark, default 5.')
+	print(' -l, --leaves              <numbers>       The comma separated tree sizes of the stages benchmark, default 1000,10000,100000.')
+	print(' -o, --results             <file>          Writes the stage times of the stages benchmark to this JSON file.')
+	print(' -p, --previous            <file>          Compares the stage times with the results of an earlier run, and')
+	print('                                           fails if a stage is slower by more than the allowed slowdown.')
+	print(' -d, --maxSlowdown         <percent>       The allowed slowdown of a stage, default 20.')
+	print('')
+
+###############################################################################
+def parseArgs(progName, argv):
+	benchmark      = "linage"
+	genusDatabase  = "SpeciesDatabase/GenusLinage.csv"
+	iterestingTaxa = ""
+	numTaxa        = 100
+	inputTree      = ""
+	numClades      = 150
+	baselineScript = ""
+	arguments      = "-h"
+	numRepeats     = 5
+	leafCounts     = [1000, 10000, 100000]
+	resultsFile    = ""
+	previousFile   = ""
+	maxSlowdown    = 20.0
+
+	try:
+		opts, args = getopt.getopt(argv,"hb:g:z:n:t:c:s:a:r:l:o:p:d:",["help", "benchmark=", "genusDatabase=", "iterestingTaxa=", "numTaxa=", "tree=", "numClades=", "baseline=", "arguments=", "repeats=", "leaves=", "results=", "previous=", "maxSlowdown="])
+	except getopt.GetoptError as err:
+		print(err, "\n")
+		usage(progName)
+		sys.exit(2)
+	for opt, arg in opts:
+		if opt in ("-h", "--help"):
+			usage(progName)
+			sys.exit()
+		elif opt in ("-b", "--benchmark"):
+			benchmark = arg
+		elif opt in ("-g", "--genusDatabase"):
+			genusDatabase = arg
+		elif opt in ("-z", "--iterestingTaxa"):
+			iterestingTaxa = arg
+		elif opt in ("-n", "--numTaxa"):
+			numTaxa = int(arg)
+		elif opt in ("-t", "--tree"):
+			inputTree = arg
+		elif opt in ("-c", "--numClades"):
+			numClades = int(arg)
+		elif opt in ("-s", "--baseline"):
+			baselineScript = arg
+		elif opt in ("-a", "--arguments"):
+			arguments = arg
+		elif opt in ("-r", "--repeats"):
+			numRepeats = int(arg)
+		elif opt in ("-l", "--leaves"):
+			leafCounts = [int(numLeaves) for numLeaves in arg.split(",")]
+		elif opt in ("-o", "--results"):
+			resultsFile = arg
+		elif opt in ("-p", "--previous"):
+			previousFile = arg
+		elif opt in ("-d", "--maxSlowdown"):
+			maxSlowdown = float(arg)
+
+	return benchmark, genusDatabase, iterestingTaxa, numTaxa, inputTree, numClades, baselineScript, arguments, numRepeats, leafCounts, resultsFile, previousFile, maxSlowdown
+
+###############################################################################
+
+if __name__ == "__main__":
+	# Execute only if run as main script
+
+	benchmark, genusDatabase, iterestingTaxa, numTaxa, inputTree, numClades, baselineScript, arguments, numRepeats, leafCounts, resultsFile, previousFile, maxSlowdown = parseArgs(sys.argv[0], sys.argv[1:])
+
+	script = loadScript()
+
+	if benchmark == "linage":
+		benchmarkLinageMatcher(script, genusDatabase, iterestingTaxa, numTaxa)
+	elif benchmark == "render":
+		benchmarkRender(script, inputTree)
+	elif benchmark == "logoCounts":
+		benchmarkLogoCounts(script, numClades)
+	elif benchmark == "startup":
+		benchmarkStartup(baselineScript, arguments, numRepeats)
+	elif benchmark == "stages":
+		benchmarkStages(leafCounts, resultsFile, previousFile, maxSlowdown)
+	else:
+		print("Unknown benchmark:", benchmark, file=sys.stderr)
+		sys.exit(2)
+
+###############################################################################
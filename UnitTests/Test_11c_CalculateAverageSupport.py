@@ -0,0 +1,62 @@
+import unittest
+import decimal
+import importlib.util
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import numpy
+
+testDir   = os.path.dirname(os.path.abspath(__file__))
+scriptDir = os.path.dirname(testDir)
+inputDir  = os.path.join(testDir, "Input_11c_CalculateAverageSupport")
+
+# The script name starts with a digit, so it cannot be imported directly
+spec = importlib.util.spec_from_file_location("CalculateAverageSupport", os.path.join(scriptDir, "11c_CalculateAverageSupport.py"))
+averageSupport = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(averageSupport)
+
+def readTable(fileName):
+	with open(fileName, "r") as tableIn:
+		return [line.rstrip("\n").split("\t") for line in tableIn]
+
+class Test_11c_CalculateAverageSupport(unittest.TestCase):
+	def test_likeShellScript(self):
+		# Input_11c_CalculateAverageSupport/TreeStatistics.csv has the averages as the
+		# shell script before 11c_CalculateAverageSupport.py prints them with bc: exact
+		# sums, quotients cut after 20 decimals, and no zero before the point.
+		# The new columns come after them.
+		with tempfile.TemporaryDirectory() as workDir:
+			for fileName in os.listdir(inputDir):
+				if fileName.endswith(".treefile"):
+					shutil.copy(os.path.join(inputDir, fileName), workDir)
+
+			# The worker pool needs the script as main module
+			result = subprocess.run([sys.executable, os.path.join(scriptDir, "11c_CalculateAverageSupport.py"), "-i", workDir, "-j", "1"], capture_output=True, text=True)
+			self.assertEqual(0, result.returncode, result.stderr)
+
+			expected = readTable(os.path.join(inputDir, "TreeStatistics.csv"))
+			rows     = readTable(os.path.join(workDir, "TreeStatistics.csv"))
+			self.assertEqual([[os.path.basename(row[0])] + row[1:] for row in expected], [[os.path.basename(row[0])] + row[1:4] for row in rows])
+
+			# Over all five labeled nodes, aBayes >= 0.95, UFBoot >= 95, and all three
+			self.assertEqual(["5", "0.4000", "0.6000", "0.4000"], rows[-1][4:5] + rows[-1][-3:])
+
+	def test_formatLikeBc(self):
+		self.assertEqual("0", averageSupport.formatLikeBc(decimal.Decimal(0)))
+		self.assertEqual(".33333333333333333333", averageSupport.formatLikeBc(averageSupport.divideLikeBc(decimal.Decimal(1), 3)))
+		self.assertEqual("-.66666666666666666666", averageSupport.formatLikeBc(averageSupport.divideLikeBc(decimal.Decimal(-2), 3)))
+		self.assertEqual("12.50000000000000000000", averageSupport.formatLikeBc(averageSupport.divideLikeBc(decimal.Decimal("25.0"), 2)))
+
+	def test_exactSum(self):
+		# 3000 values just below the limit of exact floats, their scaled sum needs more than 64 bits
+		column = numpy.array([b"450000000000.1234"] * 3000)
+		self.assertEqual(decimal.Decimal("1350000000000370.2000"), averageSupport.getExactSum(column, column.astype(float)))
+
+		column = numpy.array([b"95.5", b"0.25", b"100"])
+		self.assertEqual(decimal.Decimal("195.75"), averageSupport.getExactSum(column, column.astype(float)))
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,99 @@
+import unittest
+import importlib.util
+import os
+import random
+import tempfile
+
+import numpy
+
+testDir   = os.path.dirname(os.path.abspath(__file__))
+scriptDir = os.path.dirname(testDir)
+
+def loadModule(name, fileName):
+	# The script names start with a digit, so they cannot be imported directly
+	spec = importlib.util.spec_from_file_location(name, fileName)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+prefilter = loadModule("LeafStabilityPrefilter", os.path.join(scriptDir, "11d_LeafStabilityPrefilter.py"))
+benchmark = loadModule("BenchmarkLeafStabilityPrefilter", os.path.join(testDir, "Benchmark_11d_LeafStabilityPrefilter.py"))
+
+class Test_11d_LeafStabilityPrefilter(unittest.TestCase):
+	def rankLeaves(self, workDir, treeFile):
+		return prefilter.rankLeaves(treeFile, os.path.join(workDir, "LeafStability"), 3.5, 2.0, 0, os.path.join(workDir, "Pruned.ufboot"))
+
+	def test_pathLengths(self):
+		# The number of edges between the leaves of ((A,B),(C,(D,E)));
+		leafIndex = {}
+		positions, leafDepths, ancestorDepths, clusterStarts, clusterEnds = prefilter.readTree(b"((A:0.1,B:0.2)90:0.1,(C,(D,E)));\n", leafIndex)
+		self.assertEqual({"A": 0, "B": 1, "C": 2, "D": 3, "E": 4}, leafIndex)
+
+		pathLengths = prefilter.getPathLengths(leafDepths, ancestorDepths, numpy.arange(5))
+		self.assertEqual([
+			[0, 2, 4, 5, 5],
+			[2, 0, 4, 5, 5],
+			[4, 4, 0, 3, 3],
+			[5, 5, 3, 0, 2],
+			[5, 5, 3, 2, 0]], pathLengths.tolist())
+
+	def test_blocks(self):
+		# The sums over blocks of leaves do not depend on the block size, and
+		# the consensus clades come from the majority bipartitions
+		with tempfile.TemporaryDirectory() as workDir:
+			treeFile = os.path.join(workDir, "Trees.ufboot")
+			with open(treeFile, "w") as treesOut:
+				treesOut.write("((A,B),(C,(D,E)));\n")
+				treesOut.write("((A,B),(D,(C,E)));\n")
+				treesOut.write("((B,A),(C,(E,D)));\n")
+
+			trees = prefilter.TreeSet(treeFile)
+			self.assertEqual(3, trees.numBipartitions)
+			self.assertEqual([2, 2, 5, 2, 2], trees.getConsensusCladeSizes().tolist())
+
+			instabilities = trees.getInstabilities()
+			blockElements = prefilter.blockElements
+			try:
+				prefilter.blockElements = 10
+				numpy.testing.assert_array_equal(instabilities, trees.getInstabilities())
+			finally:
+				prefilter.blockElements = blockElements
+
+			# A and B never move against each other, C, D and E do
+			self.assertLess(instabilities[0], instabilities[2])
+			self.assertAlmostEqual(instabilities[0], instabilities[1])
+
+	def test_noRoguesInBootstrapTrees(self):
+		# The tail of the instabilities must not be taken for rogues
+		with tempfile.TemporaryDirectory() as workDir:
+			treeFile = os.path.join(workDir, "Trees.ufboot")
+			benchmark.generateTrees(treeFile, 300, 100, 0, 6)
+			self.assertEqual([], self.rankLeaves(workDir, treeFile))
+
+	def test_noRoguesInRandomTrees(self):
+		# Every leaf moves, but none more than the others
+		with tempfile.TemporaryDirectory() as workDir:
+			treeFile = os.path.join(workDir, "Trees.ufboot")
+			rng = random.Random(1)
+			leafNames = ["ID%05d" % i for i in range(300)]
+			with open(treeFile, "w") as treesOut:
+				for t in range(50):
+					rng.shuffle(leafNames)
+					treesOut.write(benchmark.writeNewick(benchmark.buildTree(list(leafNames), rng))[:-4] + ";\n")
+
+			self.assertEqual([], self.rankLeaves(workDir, treeFile))
+
+	def test_rogues(self):
+		with tempfile.TemporaryDirectory() as workDir:
+			treeFile = os.path.join(workDir, "Trees.ufboot")
+			rogues = benchmark.generateTrees(treeFile, 300, 100, 3, 6)
+			self.assertEqual(sorted(rogues), sorted(self.rankLeaves(workDir, treeFile)))
+
+			# The pruned trees keep all other leaves
+			with open(os.path.join(workDir, "Pruned.ufboot"), "r") as prunedIn:
+				for line in prunedIn:
+					positions = prefilter.readTree(line.encode(), {})[0]
+					self.assertEqual(297, len(positions))
+
+if __name__ == '__main__':
+	unittest.main()
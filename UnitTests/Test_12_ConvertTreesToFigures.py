@@ -1,12 +1,98 @@
-# This is a stub for unit testing
-# Added in case this is ever implemented
+# Tests of 12_ConvertTreesToFigures.py on the small tree in Input_12_ConvertTreesToFigures,
+# they need ete3 and run without a display
 
 import unittest
+import importlib.util
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+testDir   = os.path.dirname(os.path.abspath(__file__))
+scriptDir = os.path.dirname(testDir)
+inputDir  = os.path.join(testDir, "Input_12_ConvertTreesToFigures")
+
+hasEte3 = importlib.util.find_spec("ete3") != None
 
 class Test_12_ConvertTreesToFigures(unittest.TestCase):
-	def test_1(self):
-#		../12_ConvertTreesToFigures.py
-		self.assertEqual(6, 6)
+	@unittest.skipUnless(hasEte3, "ete3 is not installed")
+	def test_headlessRendering(self):
+		# Render a small tree like on a cluster node without a display
+		env = dict(os.environ)
+		for variable in ["DISPLAY", "WAYLAND_DISPLAY", "QT_QPA_PLATFORM"]:
+			env.pop(variable, None)
+
+		with tempfile.TemporaryDirectory() as workDir:
+			for fileName in os.listdir(inputDir):
+				shutil.copy(os.path.join(inputDir, fileName), workDir)
+
+			inputTree = "SequencesOfInterest.alignment.FAMSA.treefile"
+			result = subprocess.run([sys.executable, os.path.join(scriptDir, "12_ConvertTreesToFigures.py"), "-i", inputTree, "-c", "Clades.csv"], cwd=workDir, env=env, capture_output=True, text=True)
+			self.assertEqual(0, result.returncode, result.stderr)
+
+			for figure in ["fullTree", "tree", "collapsedTree", "collapsedTreeCom", "collapsedTreeSimple", "collapsedTreeSimpleNoSupp", "collapsedTreeLegend"]:
+				self.assertTrue(os.path.isfile(os.path.join(workDir, inputTree + ".Clades." + figure + ".pdf")), figure)
+
+	@unittest.skipUnless(hasEte3, "ete3 is not installed")
+	def test_daemon(self):
+		# Send a tree to a daemon and check that the client gets its output and exit code
+		with tempfile.TemporaryDirectory() as workDir:
+			for fileName in os.listdir(inputDir):
+				shutil.copy(os.path.join(inputDir, fileName), workDir)
+
+			env = dict(os.environ)
+			env["CONVERT_TREES_SOCKET"] = os.path.join(workDir, "daemon.socket")
+			# Without the daemon the client fails instead of running the job itself
+			env["CONVERT_TREES_REQUIRE_DAEMON"] = "1"
+			client = os.path.join(scriptDir, "12_ConvertTreesToFiguresClient.py")
+			inputTree = "SequencesOfInterest.alignment.FAMSA.treefile"
+
+			result = subprocess.run([sys.executable, client, "-i", inputTree, "-c", "Clades.csv"], cwd=workDir, env=env, capture_output=True, text=True)
+			self.assertEqual(1, result.returncode)
+			self.assertIn("No daemon on", result.stderr)
+
+			daemon = subprocess.Popen([sys.executable, os.path.join(scriptDir, "12_ConvertTreesToFigures.py"), "--serve"], env=env, stderr=subprocess.DEVNULL)
+			try:
+				# The socket gets its name once the daemon listens
+				start = time.time()
+				while not os.path.exists(env["CONVERT_TREES_SOCKET"]):
+					self.assertIsNone(daemon.poll(), "The daemon stopped")
+					self.assertLess(time.time() - start, 60, "The daemon does not listen")
+					time.sleep(0.1)
+
+				result = subprocess.run([sys.executable, client, "-i", inputTree, "-c", "Clades.csv"], cwd=workDir, env=env, capture_output=True, text=True)
+				self.assertEqual(0, result.returncode, result.stderr)
+				self.assertIn("Load tree: " + inputTree, result.stderr)
+				self.assertNotIn("Load tree: ", result.stdout)
+				self.assertTrue(os.path.isfile(os.path.join(workDir, inputTree + ".Clades.collapsedTree.pdf")))
+
+				result = subprocess.run([sys.executable, client, "-i", "Missing.treefile", "-c", "Clades.csv"], cwd=workDir, env=env, capture_output=True, text=True)
+				self.assertEqual(1, result.returncode)
+				self.assertIn("FileNotFoundError", result.stderr)
+				self.assertEqual("", result.stdout)
+
+				# A request that cannot be read still gets an exit code
+				for request in [b"no json\n", b'{"argv": [], "cwd": "' + os.path.join(workDir, "Missing").encode() + b'"}\n']:
+					with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+						connection.connect(env["CONVERT_TREES_SOCKET"])
+						connection.sendall(request)
+						response = b""
+						while True:
+							data = connection.recv(65536)
+							if not data:
+								break
+							response += data
+
+					# The last chunk is the exit code
+					self.assertEqual(b"\0\0\0\0\x011", response[-6:])
+			finally:
+				daemon.terminate()
+				daemon.wait()
+
+			self.assertFalse(os.path.exists(env["CONVERT_TREES_SOCKET"]))
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import importlib.util
+import os
+import tempfile
+
+testDir   = os.path.dirname(os.path.abspath(__file__))
+scriptDir = os.path.dirname(testDir)
+
+# The script name starts with a digit, so it cannot be imported directly
+spec = importlib.util.spec_from_file_location("CompareBipartitions", os.path.join(scriptDir, "12d_CompareBipartitions.py"))
+compareBipartitions = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(compareBipartitions)
+
+# The bipartitions are AB, CD and EF in the reference, AB, CE and DF in tree1,
+# AB, CD and EG in tree2, which has G instead of F, and AB, ABC and EF in tree3
+trees = {
+	"reference.treefile": "((A:0.1,B:0.1)100:0.2,(C,D)90:0.2,(E,F)80);\n",
+	"tree1.treefile":     "((A,B),(C,E),(D,F));\n",
+	"tree2.treefile":     "((A,B),(C,D),(E,G));\n",
+	"tree3.treefile":     "(A,(B,(C,(D,(E,F)))));\n"
+}
+
+cladeMembers = "CladeAB\tA\tB\nCladeCD\tC\tD\nCladeEF\tE\tF\n"
+
+def readTable(fileName):
+	with open(fileName, "r") as tableIn:
+		return [line.rstrip("\n").split("\t") for line in tableIn]
+
+class Test_12d_CompareBipartitions(unittest.TestCase):
+	def compare(self, workDir):
+		for treeFile, newick in trees.items():
+			with open(os.path.join(workDir, treeFile), "w") as treeOut:
+				treeOut.write(newick)
+		with open(os.path.join(workDir, "Clades.cladeMembers.tsv"), "w") as cladeMembersOut:
+			cladeMembersOut.write(cladeMembers)
+
+		treeFiles = [os.path.join(workDir, "tree" + str(i) + ".treefile") for i in range(1, 4)]
+		outPrefix = os.path.join(workDir, "Compare")
+		compareBipartitions.compareBipartitions(treeFiles, os.path.join(workDir, "Clades.cladeMembers.tsv"), os.path.join(workDir, "reference.treefile"), outPrefix, True)
+		return outPrefix
+
+	def test_trees(self):
+		with tempfile.TemporaryDirectory() as workDir:
+			outPrefix = self.compare(workDir)
+
+			# tree2 is compared on the five leaves it shares with the reference, there
+			# it has the same bipartitions, and too few leaves of CladeEF to tell
+			rows = [row[1:] for row in readTable(outPrefix + ".Trees.tsv")]
+			self.assertEqual([
+				["NumLeaves", "NumBipartitions", "RF", "CommonLeaves", "NormalizedRF", "CladeAB", "CladeCD", "CladeEF"],
+				["6", "3", "0", "6", "0.0000", "yes", "yes", "yes"],
+				["6", "3", "4", "6", "0.6667", "yes", "no",  "no"],
+				["6", "3", "0", "5", "0.0000", "yes", "yes", "NA"],
+				["6", "3", "2", "6", "0.3333", "yes", "no",  "yes"]], rows)
+
+	def test_clades(self):
+		with tempfile.TemporaryDirectory() as workDir:
+			outPrefix = self.compare(workDir)
+
+			self.assertEqual([
+				["Clade", "NumMembers", "NumTrees", "NumMonophyletic", "RecoveryFrequency"],
+				["CladeAB", "2", "4", "4", "1.0000"],
+				["CladeCD", "2", "4", "2", "0.5000"],
+				["CladeEF", "2", "3", "2", "0.6667"]], readTable(outPrefix + ".Clades.tsv"))
+
+	def test_pairwise(self):
+		with tempfile.TemporaryDirectory() as workDir:
+			outPrefix = self.compare(workDir)
+
+			rows = [row[1:] for row in readTable(outPrefix + ".RF.tsv")[1:]]
+			self.assertEqual([
+				["0", "4", "0", "2"],
+				["4", "0", "2", "4"],
+				["0", "2", "0", "2"],
+				["2", "4", "2", "0"]], rows)
+
+if __name__ == '__main__':
+	unittest.main()